@@ -0,0 +1,181 @@
+import asyncio
+import os
+from datetime import date
+from typing import Dict, List, Sequence
+
+from cache import MemoryCacheBackend
+from etag import VERSION_LIFETIME_SECONDS, current_version, space_scope
+from export import iter_goal_pages
+
+# numpy がインストールされていない場合、分析APIは 503 を返す
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy は任意の依存
+    np = None
+
+# 1回の分析で指定できるスペース数の上限
+ANALYTICS_MAX_SPACES = int(os.getenv("TODOLIS_ANALYTICS_MAX_SPACES", "50"))
+# 列形式に変換したスペースの目標を保持する件数（スペースの更新でバージョンが変わると使われなくなる）。
+# キーのバージョントークンが保持される間 (etag.VERSION_LIFETIME_SECONDS) だけ再利用できる:
+# 共有バックエンド (sqlite / redis) では書き込みがあるまで（最長 TODOLIS_VERSION_TTL_SECONDS）、
+# memory ではワーカーごとのトークンのため TODOLIS_CACHE_TTL_SECONDS ごとにSupabaseから読み直す
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("TODOLIS_ANALYTICS_CACHE_MAX_ENTRIES", "64"))
+
+STATUSES = ("todo", "doing", "done", "close")
+TODO, DOING, DONE, CLOSE = range(len(STATUSES))
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+# due_on を 1970-01-01 からの日数で持つ。期限なしはこの値
+NO_DUE = -(2 ** 31)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# 1970-01-01 は木曜日なので、月曜始まりの週に揃えるためのずらし幅
+WEEK_OFFSET = 4
+# 期限の週の範囲がこれより狭い場合は、週の添字を差分で求める
+MAX_WEEK_SPAN = 100_000
+
+ANALYTICS_COLUMNS = "id,status,assignee,due_on,created_at"
+
+_space_columns = MemoryCacheBackend(max_entries=ANALYTICS_CACHE_MAX_ENTRIES, ttl=VERSION_LIFETIME_SECONDS)
+
+
+class GoalColumns:
+    """
+    目標を列ごとの numpy 配列で保持する。
+    space / assignee は space_ids / assignees への添字、status は STATUSES への添字、
+    due_on は 1970-01-01 からの日数（期限なしは NO_DUE）。
+    """
+
+    def __init__(self, space_ids: List[str], space, assignees: List[str], assignee, status, due_on):
+        self.space_ids = space_ids
+        self.space = space
+        self.assignees = assignees
+        self.assignee = assignee
+        self.status = status
+        self.due_on = due_on
+
+    def __len__(self):
+        return len(self.status)
+
+    @classmethod
+    def from_rows(cls, space_id: str, rows: Sequence[dict]) -> "GoalColumns":
+        """PostgRESTから取得した目標の行を列形式に変換する。"""
+        assignee_codes: Dict[str, int] = {}
+        assignee = np.fromiter((assignee_codes.setdefault(row.get("assignee") or "", len(assignee_codes))
+                                for row in rows), dtype=np.int32, count=len(rows))
+        status = np.fromiter((STATUS_CODES.get(row.get("status"), TODO) for row in rows),
+                             dtype=np.int8, count=len(rows))
+        due_on = np.fromiter((date.fromisoformat(row["due_on"][:10]).toordinal() - EPOCH_ORDINAL
+                              if row.get("due_on") else NO_DUE for row in rows),
+                             dtype=np.int32, count=len(rows))
+        return cls([space_id], np.zeros(len(rows), dtype=np.int32), list(assignee_codes), assignee, status, due_on)
+
+    @classmethod
+    def concat(cls, parts: Sequence["GoalColumns"]) -> "GoalColumns":
+        """複数スペース分の列を、スペース・担当者の添字を振り直して1つにまとめる。"""
+        if len(parts) == 1:
+            # 1スペースだけなら配列をそのまま使う（スナップショットのメモリマップをコピーしない）
+            return parts[0]
+        space_ids: List[str] = []
+        assignee_codes: Dict[str, int] = {}
+        spaces, assignees, statuses, due_ons = [], [], [], []
+        for part in parts:
+            space_map = np.arange(len(space_ids), len(space_ids) + len(part.space_ids), dtype=np.int32)
+            space_ids.extend(part.space_ids)
+            assignee_map = np.array([assignee_codes.setdefault(name, len(assignee_codes)) for name in part.assignees],
+                                    dtype=np.int32)
+            spaces.append(space_map[part.space] if len(part) else part.space)
+            assignees.append(assignee_map[part.assignee] if len(part) else part.assignee)
+            statuses.append(part.status)
+            due_ons.append(part.due_on)
+        if not parts:
+            return cls([], np.zeros(0, dtype=np.int32), [], np.zeros(0, dtype=np.int32),
+                       np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int32))
+        return cls(space_ids, np.concatenate(spaces), list(assignee_codes), np.concatenate(assignees),
+                   np.concatenate(statuses), np.concatenate(due_ons))
+
+
+async def load_space_columns(space_id: str) -> GoalColumns:
+    """
+    スペースの目標を列形式で返す。スペースのバージョンが変わっていなければ変換済みの列を再利用する。
+    列形式への変換は行数に比例するCPU処理なので、イベントループを止めないよう別スレッドで行う。
+    """
+    cache_key = (space_id, await current_version(space_scope(space_id)))
+    cached = _space_columns.get(cache_key)
+    if cached is not None:
+        return cached
+    rows = []
+    async for goals in iter_goal_pages(space_id, ANALYTICS_COLUMNS):
+        rows.extend(goals)
+    columns = await asyncio.to_thread(GoalColumns.from_rows, space_id, rows)
+    _space_columns.set(cache_key, columns, group=space_id)
+    return columns
+
+
+def _group_stats(keys: list, counts, overdue, key_name: str) -> List[dict]:
+    """(グループ数, ステータス数) の件数と期限切れ件数から、グループごとの集計結果を作る。"""
+    done = counts[:, DONE]
+    todo = counts[:, TODO]
+    total = done + todo
+    rates = np.round(np.divide(done * 100.0, total, out=np.zeros(len(total)), where=total > 0), 2)
+    present = counts.sum(axis=1) > 0
+    return [
+        {
+            key_name: key,
+            "total_count": int(total[i]),
+            "status_counts": dict(zip(STATUSES, counts[i].tolist())),
+            "achievement_rate": float(rates[i]),
+            "overdue_count": int(overdue[i]),
+        }
+        for i, key in enumerate(keys) if present[i]
+    ]
+
+
+def compute(columns: GoalColumns, as_of: date) -> dict:
+    """
+    担当者別・期限の週別・スペース別の達成率と期限切れ件数をまとめて計算する。
+    達成率は他のAPIと同じく done / (done + todo)。期限切れは期限が as_of より前の todo / doing の目標。
+    集計はすべて np.bincount による一括計算で、行ごとのPythonループは行わない。
+    """
+    n_status = len(STATUSES)
+    status = columns.status.astype(np.int64)
+    has_due = columns.due_on != NO_DUE
+    today = as_of.toordinal() - EPOCH_ORDINAL
+    overdue = has_due & (columns.due_on < today) & ((status == TODO) | (status == DOING))
+
+    def grouped(codes, n_groups):
+        counts = np.bincount(codes * n_status + status, minlength=n_groups * n_status).reshape(n_groups, n_status)
+        return counts, np.bincount(codes[overdue], minlength=n_groups)
+
+    space_counts, space_overdue = grouped(columns.space.astype(np.int64), len(columns.space_ids))
+    assignee_counts, assignee_overdue = grouped(columns.assignee.astype(np.int64), len(columns.assignees))
+
+    # 期限のある目標を、期限が含まれる週（月曜始まり）ごとに集計する
+    weeks = (columns.due_on[has_due].astype(np.int64) - WEEK_OFFSET) // 7
+    if len(weeks) and weeks.max() - weeks.min() < MAX_WEEK_SPAN:
+        # 週の範囲が狭ければ、ソートを伴う np.unique を使わずに最小の週からの差を添字にする
+        first_week = weeks.min()
+        week_codes = weeks - first_week
+        week_keys = np.arange(first_week, weeks.max() + 1)
+    else:
+        week_keys, week_codes = np.unique(weeks, return_inverse=True)
+        week_codes = week_codes.reshape(-1)
+    week_counts = np.bincount(week_codes * n_status + status[has_due],
+                              minlength=len(week_keys) * n_status).reshape(len(week_keys), n_status)
+    week_overdue = np.bincount(week_codes[overdue[has_due]], minlength=len(week_keys))
+    week_starts = [(date.fromordinal(EPOCH_ORDINAL + int(week) * 7 + WEEK_OFFSET)).isoformat() for week in week_keys]
+
+    totals = space_counts.sum(axis=0)
+    total = int(totals[DONE] + totals[TODO])
+    return {
+        "as_of": as_of.isoformat(),
+        "space_ids": columns.space_ids,
+        "goal_count": len(columns),
+        "total_count": total,
+        "status_counts": dict(zip(STATUSES, totals.tolist())),
+        "achievement_rate": round(int(totals[DONE]) / total * 100, 2) if total else 0.0,
+        "overdue_count": int(overdue.sum()),
+        "no_due_count": int((~has_due).sum()),
+        "spaces": _group_stats(columns.space_ids, space_counts, space_overdue, "space_id"),
+        "assignees": _group_stats([name or None for name in columns.assignees],
+                                  assignee_counts, assignee_overdue, "assignee"),
+        "due_weeks": _group_stats(week_starts, week_counts, week_overdue, "week_start"),
+    }
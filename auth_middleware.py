@@ -0,0 +1,78 @@
+import hashlib
+import hmac
+import os
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+from cache import MemoryCacheBackend
+from repository import execute, table
+
+# 権限レベル（数値が大きいほど強い権限）
+PERMISSION_LEVELS = {"view": 1, "edit": 2}
+
+# 検証済みトークンのキャッシュ設定。トークン更新時の反映が遅れる最大時間がTTLになる
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("TODOLIS_AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("TODOLIS_AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+# (space_id, トークンのハッシュ値) -> 権限レベル。トークンそのものはメモリに保持しない
+_verified_tokens = MemoryCacheBackend(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+def _digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def _match_permission(token_digest: bytes, space: dict) -> Optional[str]:
+    """
+    トークンのハッシュ値をスペースの編集用・閲覧用トークンと比較し、一致した権限レベルを返す。
+    長さが揃ったハッシュ値同士を hmac.compare_digest で比較し、両方とも必ず比較することで、
+    処理時間からトークンの内容や一致した種類が推測されないようにする。
+    """
+    is_edit = hmac.compare_digest(token_digest, _digest(space.get("edit_token") or ""))
+    is_view = hmac.compare_digest(token_digest, _digest(space.get("view_token") or ""))
+    if is_edit:
+        return "edit"
+    if is_view:
+        return "view"
+    return None
+
+
+async def authenticate_token(space_id: str, token: Optional[str], required_level: str = "view") -> Tuple[str, str]:
+    """
+    スペースのトークンを検証し、(権限レベル, space_id) を返す。
+    検証済みのトークンは一定時間キャッシュし、その間はSupabaseへ問い合わせない。
+    トークンが無い場合は401、一致しない・権限が足りない場合は403、スペースが無い場合は404を返す。
+    """
+    if not token:
+        raise HTTPException(status_code=401, detail="Token is required")
+
+    token_digest = _digest(token)
+    cache_key = (space_id, token_digest)
+    permission_level = _verified_tokens.get(cache_key)
+
+    if permission_level is None:
+        space_res = await execute(table("spaces")
+                                  .select("view_token,edit_token")
+                                  .eq("id", space_id)
+                                  .maybe_single())
+        if not space_res or not space_res.data:
+            raise HTTPException(status_code=404, detail=f"Space with id {space_id} not found")
+
+        permission_level = _match_permission(token_digest, space_res.data)
+        if permission_level is None:
+            raise HTTPException(status_code=403, detail="Invalid token")
+        _verified_tokens.set(cache_key, permission_level, group=space_id)
+
+    if PERMISSION_LEVELS[permission_level] < PERMISSION_LEVELS[required_level]:
+        raise HTTPException(status_code=403, detail=f"{required_level} permission is required")
+
+    return permission_level, space_id
+
+
+def revoke_space_tokens(space_id: str) -> None:
+    """
+    スペースのトークンを再発行・無効化した際に呼び出し、キャッシュ済みの検証結果を破棄する。
+    （キャッシュはワーカーごとのため、他のワーカーではTTL経過後に反映される）
+    """
+    _verified_tokens.invalidate(space_id)
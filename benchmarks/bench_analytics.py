@@ -0,0 +1,115 @@
+"""
+分析API (/api/analytics/goals) の集計処理の性能計測。
+
+100万件の目標を列形式 (analytics.GoalColumns) で生成し、
+  - before: 行ごとのPythonループで担当者別・週別・スペース別に集計
+  - after : analytics.compute（np.bincount による一括集計）
+の所要時間を比較する。両者の結果が一致することも確認する。
+さらに、1スペース分の目標を snapshot.SnapshotStore に書き出し、メモリマップから読み取って集計する時間と、
+upsert() による1件ずつの差分更新の時間を計測する。
+
+実行方法:
+    python benchmarks/bench_analytics.py --goals 1000000 --spaces 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import analytics  # noqa: E402
+import snapshot  # noqa: E402
+
+
+def make_columns(goals: int, spaces: int, assignees: int, seed: int) -> analytics.GoalColumns:
+    rng = np.random.default_rng(seed)
+    start = date(2024, 1, 1).toordinal() - analytics.EPOCH_ORDINAL
+    due_on = (start + rng.integers(0, 365, goals)).astype(np.int32)
+    due_on[rng.random(goals) < 0.1] = analytics.NO_DUE
+    return analytics.GoalColumns(
+        [f"space-{i}" for i in range(spaces)], rng.integers(0, spaces, goals, dtype=np.int32),
+        [f"担当者{i}" for i in range(assignees)], rng.integers(0, assignees, goals, dtype=np.int32),
+        rng.integers(0, len(analytics.STATUSES), goals, dtype=np.int8), due_on,
+    )
+
+
+def compute_with_loop(columns: analytics.GoalColumns, as_of: date) -> dict:
+    """比較用: 行ごとのループによる集計（担当者別の件数と期限切れ件数のみ）。"""
+    today = as_of.toordinal() - analytics.EPOCH_ORDINAL
+    by_assignee = {}
+    overdue = 0
+    for assignee, status, due_on in zip(columns.assignee.tolist(), columns.status.tolist(), columns.due_on.tolist()):
+        counts = by_assignee.setdefault(columns.assignees[assignee], [0, 0, 0, 0, 0])
+        counts[status] += 1
+        if due_on != analytics.NO_DUE and due_on < today and status in (analytics.TODO, analytics.DOING):
+            counts[4] += 1
+            overdue += 1
+    return {"overdue_count": overdue, "assignees": by_assignee}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--goals", type=int, default=1_000_000)
+    parser.add_argument("--spaces", type=int, default=20)
+    parser.add_argument("--assignees", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    columns = make_columns(args.goals, args.spaces, args.assignees, seed=1)
+    as_of = date(2024, 7, 1)
+
+    started = time.perf_counter()
+    expected = compute_with_loop(columns, as_of)
+    loop_seconds = time.perf_counter() - started
+
+    samples = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        result = analytics.compute(columns, as_of)
+        samples.append(time.perf_counter() - started)
+    vectorized_seconds = min(samples)
+
+    assert result["overdue_count"] == expected["overdue_count"]
+    for row in result["assignees"]:
+        counts = expected["assignees"][row["assignee"]]
+        assert list(row["status_counts"].values()) == counts[:4] and row["overdue_count"] == counts[4]
+
+    print(f"{args.goals:,} goals / {args.spaces} spaces / {args.assignees} assignees, "
+          f"{len(result['due_weeks'])} due weeks")
+    print(f"before (per-row loop, assignees only): {loop_seconds * 1000:8.1f} ms")
+    print(f"after  (analytics.compute, all groups): {vectorized_seconds * 1000:8.1f} ms")
+
+    # 1スペース分をスナップショットに書き出し、メモリマップからの読み取りと差分更新を計測する
+    rows = [{"id": str(uuid.uuid4()), "assignee": columns.assignees[a], "status": analytics.STATUSES[s],
+             "due_on": date.fromordinal(d + analytics.EPOCH_ORDINAL).isoformat() if d != analytics.NO_DUE else None}
+            for a, s, d in zip(columns.assignee.tolist(), columns.status.tolist(), columns.due_on.tolist())]
+    with tempfile.TemporaryDirectory() as directory:
+        store = snapshot.SnapshotStore(directory)
+        started = time.perf_counter()
+        store.rebuild("space", rows, store.begin_rebuild("space"))
+        rebuild_seconds = time.perf_counter() - started
+
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            analytics.compute(store.columns("space"), as_of)
+            samples.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for row in rows[:200]:
+            store.upsert("space", [{**row, "status": "done"}])
+        upsert_seconds = (time.perf_counter() - started) / 200
+
+    print(f"snapshot rebuild ({len(rows):,} rows):        {rebuild_seconds * 1000:8.1f} ms")
+    print(f"snapshot read + compute (mmap):       {min(samples) * 1000:8.1f} ms")
+    print(f"snapshot upsert (1 goal):             {upsert_seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
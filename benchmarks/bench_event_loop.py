@@ -0,0 +1,85 @@
+"""
+イベントループのブロッキング有無による処理性能の比較ベンチマーク。
+
+ローカルに PostgREST の代わりとなる簡易HTTPサーバー（1リクエストあたり LATENCY 秒待機）を立て、
+同じ非同期ハンドラーを
+  - before: クエリビルダーの .execute() を直接呼ぶ（イベントループをブロック）
+  - after : repository.execute() 経由でスレッドプールにオフロード
+の2通りで同時実行し、requests/sec を比較する。
+
+実行方法:
+    python benchmarks/bench_event_loop.py --requests 400 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase import create_client  # noqa: E402
+
+import repository  # noqa: E402
+
+LATENCY = 0.02
+
+
+class _SlowPostgrestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY)
+        body = json.dumps([{"id": "1", "status": "todo"}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def _run(client, total, concurrency, offload):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def handler():
+        async with sem:
+            query = client.table("goals").select("id,status").eq("space_id", "bench")
+            if offload:
+                await repository.execute(query)
+            else:
+                query.execute()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    global LATENCY
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    args = parser.parse_args()
+    LATENCY = args.latency
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowPostgrestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = create_client(f"http://127.0.0.1:{server.server_port}", "bench-key")
+
+    before = asyncio.run(_run(client, args.requests, args.concurrency, offload=False))
+    after = asyncio.run(_run(client, args.requests, args.concurrency, offload=True))
+    server.shutdown()
+
+    print(f"upstream latency : {LATENCY * 1000:.0f} ms")
+    print(f"pool size        : {repository.SUPABASE_POOL_SIZE}")
+    print(f"before (blocking): {before:8.1f} req/s")
+    print(f"after  (offload) : {after:8.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+CSV一括取り込み (POST /api/spaces/{space_id}/goals/import) のスループット計測。
+
+benchmarks/fake_postgrest.py をSupabaseの代わりにプロセス内で起動し、
+goals.csv と同じカラム構成のCSVを生成してAPIへストリーミングで送信し、1秒あたりの取り込み行数を出力する。
+続けて、途中の行から再開 (start_row) した場合と、同じファイルを再実行した場合に目標が重複しないことも確認する。
+
+実行方法:
+    python benchmarks/bench_import.py --rows 50000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fake_postgrest  # noqa: E402
+from load_test import load_samples  # noqa: E402
+
+
+def make_csv(rows: int, with_ids: bool) -> bytes:
+    samples = load_samples()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(("id", "space_id", "title", "detail", "assignee", "status", "due_on", "tags",
+                     "order_index", "created_at", "updated_at"))
+    for i in range(rows):
+        n = i % len(samples["title"])
+        writer.writerow((
+            str(uuid.uuid4()) if with_ids else "", "", samples["title"][n], samples["detail"][n],
+            samples["assignee"][i % len(samples["assignee"])], ("todo", "doing", "done")[i % 3],
+            f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", ",".join(samples["tags"][n]), i + 1,
+            "2024-01-01 09:00:00+09", "2024-01-01 09:00:00+09",
+        ))
+    return buffer.getvalue().encode("utf-8")
+
+
+def chunks(data: bytes, size: int = 64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--with-ids", action="store_true", help="CSVの id 列を埋める（既存IDの確認が走る）")
+    args = parser.parse_args()
+
+    server, db = fake_postgrest.start_server(0)
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["SUPABASE_KEY"] = "benchmark-key"
+
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    space_id = str(uuid.uuid4())
+    edit_token = str(uuid.uuid4())
+    db.put("spaces", {"id": space_id, "title": "import", "view_token": str(uuid.uuid4()), "edit_token": edit_token,
+                      "created_at": "2024-01-01T00:00:00+00:00", "updated_at": "2024-01-01T00:00:00+00:00"})
+    client = TestClient(app_main.app)
+    data = make_csv(args.rows, args.with_ids)
+    url = f"/api/spaces/{space_id}/goals/import"
+    print(f"CSV: {args.rows} rows, {len(data) / 1024 / 1024:.1f} MiB")
+
+    started = time.perf_counter()
+    report = client.post(url, params={"token": edit_token}, content=chunks(data)).json()
+    elapsed = time.perf_counter() - started
+    print(f"import:  {report['imported_rows']} rows in {elapsed:.2f}s = {report['imported_rows'] / elapsed:,.0f} rows/s "
+          f"(failed {report['failed_rows']})")
+
+    half = args.rows // 2
+    report = client.post(url, params={"token": edit_token, "start_row": half + 1, "import_id": report["import_id"]},
+                         content=chunks(data)).json()
+    print(f"resume from row {half + 1}: processed {report['processed_rows']} rows")
+
+    goal_count = len(db.tables["goals"])
+    print(f"goals in space after re-import: {goal_count} (expected {args.rows})")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
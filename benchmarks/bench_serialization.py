@@ -0,0 +1,115 @@
+"""
+大きな一覧レスポンスのシリアライズ性能の比較ベンチマーク。
+
+10,000件の目標を持つスペース相当の get_goals_list のレスポンス（と、同規模のコメント一覧）を
+  - before: dict を返し、FastAPI標準の jsonable_encoder + JSONResponse（標準ライブラリの json）でシリアライズ
+  - after : FastJSONResponse を直接返す（orjson。jsonable_encoder を経由しない）
+の2通りでエンコードし、1レスポンスあたりの所要時間を比較する。
+加えて、TestClient 経由でエンドポイント全体（Supabase呼び出しはモック）の所要時間も計測する。
+
+実行方法:
+    python benchmarks/bench_serialization.py --goals 10000 --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import responses  # noqa: E402
+
+
+def make_goals(n):
+    jst = timezone(timedelta(hours=+9))
+    base = datetime(2024, 1, 1, 9, tzinfo=jst)
+    return [{
+        "id": str(uuid.uuid4()),
+        "title": f"要件定義書の作成 {i}",
+        "detail": "クライアントとの打ち合わせ内容を整理し、要件定義書を作成する",
+        "assignee": ["田中太郎", "佐藤花子", "鈴木一郎"][i % 3],
+        "due_on": (date(2024, 1, 25) + timedelta(days=i % 90)).isoformat(),
+        "status": "done" if i % 3 == 0 else "todo",
+        "created_at": (base + timedelta(minutes=i)).isoformat(),
+    } for i in range(n)]
+
+
+def goals_payload(goals):
+    done = [g for g in goals if g["status"] == "done"]
+    todo = [g for g in goals if g["status"] == "todo"]
+    return {
+        "space_id": str(uuid.uuid4()), "total_count": len(goals), "done_count": len(done),
+        "todo_count": len(todo), "achievement_rate": round(len(done) / len(goals) * 100, 2),
+        "done_tasks": done, "todo_tasks": todo,
+    }
+
+
+def timeit(fn, repeat):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def report(label, before_ms, after_ms):
+    print(f"{label:<34}before {before_ms:8.2f} ms   after {after_ms:8.2f} ms   x{before_ms / after_ms:5.1f}")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--goals", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    goals = make_goals(args.goals)
+    payload = goals_payload(goals)
+    comments = [{"id": g["id"], "author": g["assignee"], "body": g["detail"], "created_at": g["created_at"]}
+                for g in goals]
+
+    print(f"encoder: {'orjson' if responses.orjson is not None else 'json (orjson not installed)'}")
+    size = len(responses.dumps(payload))
+    print(f"goals list payload: {args.goals} goals, {size / 1024:.0f} KiB\n")
+
+    report("goals list (serialize)",
+           timeit(lambda: JSONResponse(jsonable_encoder(payload)), args.repeat),
+           timeit(lambda: responses.FastJSONResponse(payload), args.repeat))
+    report("comments (serialize)",
+           timeit(lambda: JSONResponse(jsonable_encoder(comments)), args.repeat),
+           timeit(lambda: responses.FastJSONResponse(comments), args.repeat))
+
+    # エンドポイント全体: Supabaseの応答をモックし、キャッシュを無効にして毎回シリアライズさせる
+    space_id = payload["space_id"]
+
+    async def fake_execute(query):
+        return SimpleNamespace(data=[dict(g) for g in goals])
+
+    main.execute = fake_execute
+    main.space_cache.get = lambda key: None
+    client = TestClient(main.app)
+    url = f"/api/goals/list/{space_id}/get/"
+    after_ms = timeit(lambda: client.get(url), args.repeat)
+
+    # before: 以前と同様に dict を返すエンドポイントを用意して比較する
+    @main.app.get("/bench/dict/{space_id}", response_class=JSONResponse)
+    async def dict_endpoint(space_id: str):
+        res = await fake_execute(None)
+        return goals_payload(res.data)
+
+    before_ms = timeit(lambda: client.get(f"/bench/dict/{space_id}"), args.repeat)
+    report("goals list (endpoint, TestClient)", before_ms, after_ms)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,82 @@
+"""
+スペース詳細・目標一覧の読み取りの同時リクエストをまとめる (singleflight.SingleFlight) 効果の計測。
+
+benchmarks/fake_postgrest.py をSupabaseの代わりにプロセス内で起動し（往復の遅延を --latency-ms で指定）、
+共有リンクを開いた直後のように、キャッシュが空の状態で同じスペースへの読み取りを --clients 件同時に送る。
+まとめない場合（キーごとに別の問い合わせ）とまとめる場合とで、応答時間とSupabaseへの呼び出し回数を比較する。
+
+実行方法:
+    python benchmarks/bench_singleflight.py --clients 200 --latency-ms 30
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fake_postgrest  # noqa: E402
+import load_test  # noqa: E402
+
+
+async def run(args, space_id: str):
+    import httpx
+    import main as app_main
+    from singleflight import SingleFlight
+
+    class NoCoalescing(SingleFlight):
+        async def do(self, key, fn):
+            return await fn()
+
+    paths = [f"/api/spaces/{space_id}/get/", f"/api/goals/list/{space_id}/get/"]
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, flight in (("no coalescing", NoCoalescing), ("single-flight", SingleFlight)):
+            app_main.space_details_flight = flight("space_details")
+            app_main.goals_list_flight = flight("goals_list")
+            app_main.space_cache.clear()
+
+            async def get(path: str):
+                started = time.perf_counter()
+                res = await client.get(path)
+                res.raise_for_status()
+                return (time.perf_counter() - started) * 1000, int(res.headers["x-upstream-calls"])
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(get(paths[i % len(paths)]) for i in range(args.clients)))
+            elapsed = time.perf_counter() - started
+            latencies = sorted(ms for ms, _ in results)
+            print(f"{label:>14}: p50 {statistics.median(latencies):7.1f} ms  "
+                  f"p95 {latencies[int(len(latencies) * 0.95)]:7.1f} ms  total {elapsed * 1000:6.0f} ms  "
+                  f"upstream calls {sum(calls for _, calls in results)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200, help="同時に送る読み取りリクエストの数")
+    parser.add_argument("--goals", type=int, default=500, help="スペースの目標数")
+    parser.add_argument("--latency-ms", type=float, default=30, help="fake_postgrest の1リクエストあたりの遅延")
+    args = parser.parse_args()
+
+    server, db = fake_postgrest.start_server(0, latency=args.latency_ms / 1000)
+    supabase_url = f"http://127.0.0.1:{server.server_port}"
+    os.environ["SUPABASE_URL"] = supabase_url
+    os.environ["SUPABASE_KEY"] = "benchmark-key"
+
+    data = load_test.generate_dataset(argparse.Namespace(spaces=1, goals_per_space=args.goals, members_per_space=5,
+                                                         comments_per_goal=0, reactions_per_goal=0),
+                                      random.Random(0))
+    load_test.seed(supabase_url, data)
+    print(f"{args.clients} concurrent cold reads of one space ({args.goals} goals), "
+          f"upstream latency {args.latency_ms} ms")
+    asyncio.run(run(args, data["spaces"][0]["id"]))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
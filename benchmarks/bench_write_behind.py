@@ -0,0 +1,107 @@
+"""
+コメント・リアクション作成の書き込みキュー (TODOLIS_WRITE_BEHIND=1) の効果の計測。
+
+benchmarks/fake_postgrest.py をSupabaseの代わりにプロセス内で起動し（往復の遅延を --latency-ms で指定）、
+1つの目標へのコメント・リアクションを --burst 件同時に作成したときの応答時間と、
+Supabaseへの呼び出し回数を、1件ずつ挿入する場合と書き込みキューを使う場合とで比較する。
+
+実行方法:
+    python benchmarks/bench_write_behind.py --burst 500 --latency-ms 30
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import fake_postgrest  # noqa: E402
+
+
+async def burst(client, goal_id: str, count: int) -> list:
+    async def post(i: int) -> float:
+        started = time.perf_counter()
+        if i % 2:
+            res = await client.post(f"/api/goals/{goal_id}/reactions/add/", json={"author": f"user{i}", "emoji": "👍"})
+        else:
+            res = await client.post(f"/api/goals/{goal_id}/comments/add/", json={"author": f"user{i}", "body": f"c{i}"})
+        res.raise_for_status()
+        return (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(post(i) for i in range(count)))
+
+
+async def run(args):
+    import httpx
+    import main as app_main
+    import repository
+    import write_behind
+
+    # Supabaseへの呼び出し回数を数える
+    calls = Counter()
+    record_upstream = repository.record_upstream
+
+    def counting_record_upstream(table_name, operation, seconds, ok):
+        calls["insert" if operation in ("insert", "upsert") else "other"] += 1
+        record_upstream(table_name, operation, seconds, ok)
+
+    repository.record_upstream = counting_record_upstream
+
+    goal_id = args.goal_id
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, queue in (("direct insert", None),
+                             ("write-behind", write_behind.WriteBehindQueue(directory=tempfile.mkdtemp(),
+                                                                            on_flushed=app_main.mark_goals_written))):
+            app_main.write_queue = queue
+            if queue is not None:
+                await queue.start()
+            # 目標IDから所属スペースIDへの対応をキャッシュさせておく
+            await burst(client, goal_id, 1)
+            calls.clear()
+            started = time.perf_counter()
+            latencies = sorted(await burst(client, goal_id, args.burst))
+            acked = time.perf_counter() - started
+            if queue is not None:
+                await queue.drain()
+            stored = time.perf_counter() - started
+            print(f"{label:>14}: p50 {statistics.median(latencies):7.1f} ms  "
+                  f"p95 {latencies[int(len(latencies) * 0.95)]:7.1f} ms  "
+                  f"all acked {acked * 1000:7.0f} ms  all stored {stored * 1000:7.0f} ms  "
+                  f"upstream inserts {calls['insert']} / other {calls['other']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=500, help="同時に作成するコメント・リアクションの件数")
+    parser.add_argument("--latency-ms", type=float, default=30, help="fake_postgrest の1リクエストあたりの遅延")
+    args = parser.parse_args()
+
+    server, db = fake_postgrest.start_server(0, latency=args.latency_ms / 1000)
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["SUPABASE_KEY"] = "benchmark-key"
+
+    space_id = str(uuid.uuid4())
+    args.goal_id = str(uuid.uuid4())
+    db.put("spaces", {"id": space_id, "title": "bench", "view_token": str(uuid.uuid4()), "edit_token": str(uuid.uuid4()),
+                      "created_at": "2024-01-01T00:00:00+00:00", "updated_at": "2024-01-01T00:00:00+00:00"})
+    db.put("goals", {"id": args.goal_id, "space_id": space_id, "title": "bench", "detail": "", "assignee": "a",
+                     "status": "todo", "due_on": None, "tags": [], "order_index": 1,
+                     "created_at": "2024-01-01T00:00:00+00:00", "updated_at": "2024-01-01T00:00:00+00:00"})
+    print(f"burst: {args.burst} comments/reactions on one goal, upstream latency {args.latency_ms} ms")
+    asyncio.run(run(args))
+    expected = 2 * (args.burst + 1)  # 各方式のウォームアップ1件を含む
+    stored = len(db.tables["comments"]) + len(db.tables["reactions"])
+    print(f"rows stored: {stored} (expected {expected})")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+"""
+ベンチマーク用の PostgREST (Supabase REST API) の簡易代替サーバー。
+
+main.py が使う範囲のPostgRESTの機能だけをメモリ上のテーブルで再現する。
+  - GET    /rest/v1/<table>  : select（カラム指定・リソース埋め込み・count集計）、eq/neq/gt/gte/lt/lte/in/is/or フィルター、order、limit、offset
+  - POST   /rest/v1/<table>  : insert / upsert (Prefer: resolution=merge-duplicates | ignore-duplicates)
+  - PATCH  /rest/v1/<table>  : update
+  - DELETE /rest/v1/<table>  : delete
+  - POST   /rest/v1/rpc/<fn> : supabase/migrations のストアドファンクションのPython実装
+goals への書き込み時には space_goal_counters をトリガーと同様に更新する。
+
+単体で起動する場合:
+    python benchmarks/fake_postgrest.py --port 54321 --latency-ms 5
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+TABLES = ("spaces", "space_members", "goals", "comments", "reactions", "space_goal_counters")
+TIMESTAMP_COLUMNS = ("created_at", "updated_at")
+# 埋め込み時の外部キー（親テーブル -> 子テーブルが持つカラム）
+FOREIGN_KEYS = {"spaces": "space_id", "goals": "goal_id"}
+PRIMARY_KEYS = {"space_goal_counters": ("space_id", "status", "assignee")}
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def normalize_timestamp(value):
+    """PostgreSQLのtimestamptzと同様に、タイムスタンプをUTCのISO形式に揃える。"""
+    if not isinstance(value, str):
+        return value
+    return datetime.fromisoformat(value).astimezone(timezone.utc).isoformat()
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Database:
+    """メモリ上のテーブル群。すべての操作は1つのロックで直列化する。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {name: {} for name in TABLES}  # テーブル名 -> {主キー: 行}
+        # 子テーブルの外部キーによる索引: (テーブル, カラム) -> {値: {主キー, ...}}
+        self.indexes = {("space_members", "space_id"): {}, ("goals", "space_id"): {},
+                        ("comments", "goal_id"): {}, ("reactions", "goal_id"): {},
+                        ("space_goal_counters", "space_id"): {}}
+
+    # --- 行の操作 -------------------------------------------------------------
+    def key_of(self, table, row):
+        columns = PRIMARY_KEYS.get(table)
+        if columns:
+            return tuple(row.get(c) for c in columns)
+        return row["id"]
+
+    def put(self, table, row):
+        key = self.key_of(table, row)
+        old = self.tables[table].get(key)
+        if old is not None:
+            self._unindex(table, key, old)
+        self.tables[table][key] = row
+        self._index(table, key, row)
+        if table == "goals":
+            self._maintain_counters(old, row)
+        return old
+
+    def remove(self, table, key):
+        row = self.tables[table].pop(key)
+        self._unindex(table, key, row)
+        if table == "goals":
+            self._maintain_counters(row, None)
+        return row
+
+    def _index(self, table, key, row):
+        for (t, column), index in self.indexes.items():
+            if t == table:
+                index.setdefault(row.get(column), set()).add(key)
+
+    def _unindex(self, table, key, row):
+        for (t, column), index in self.indexes.items():
+            if t == table:
+                keys = index.get(row.get(column))
+                if keys is not None:
+                    keys.discard(key)
+
+    def _maintain_counters(self, old, new):
+        # goals_maintain_counters トリガーと同じ差分更新
+        def bump(row, delta):
+            key = (row["space_id"], row["status"], row.get("assignee") or "")
+            counters = self.tables["space_goal_counters"]
+            counter = counters.get(key)
+            if counter is None:
+                counter = {"space_id": key[0], "status": key[1], "assignee": key[2], "goal_count": 0}
+                counters[key] = counter
+                self._index("space_goal_counters", key, counter)
+            counter["goal_count"] += delta
+
+        if old is not None and new is not None and all(
+                old.get(c) == new.get(c) for c in ("space_id", "status", "assignee")):
+            return
+        if old is not None:
+            bump(old, -1)
+        if new is not None:
+            bump(new, 1)
+
+    def candidates(self, table, filters):
+        """eqフィルターに使える索引があれば、それで候補行を絞り込む。"""
+        for column, op, value in filters:
+            if op == "eq" and (table, column) in self.indexes:
+                keys = self.indexes[(table, column)].get(value, ())
+                return [self.tables[table][k] for k in keys]
+            if op == "in" and (table, column) in self.indexes:
+                index = self.indexes[(table, column)]
+                return [self.tables[table][k] for v in value for k in index.get(v, ())]
+            if op in ("eq", "in") and column == "id" and table not in PRIMARY_KEYS:
+                rows = (self.tables[table].get(v) for v in (value if op == "in" else [value]))
+                return [row for row in rows if row is not None]
+        return list(self.tables[table].values())
+
+
+# --- クエリ文字列の解析 --------------------------------------------------------
+
+def split_top_level(text: str, sep: str = ","):
+    """括弧と引用符の外側にある区切り文字で分割する。"""
+    parts, depth, quoted, current = [], 0, False, []
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == sep and depth == 0 and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    if current or parts:
+        parts.append("".join(current))
+    return parts
+
+
+def unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def parse_select(select: str):
+    """select=... を [(カラム名 または (埋め込みテーブル, 子のselect))] に変換する。"""
+    items = []
+    for part in split_top_level(select or "*"):
+        part = part.strip()
+        match = re.fullmatch(r"(\w+)\((.*)\)", part)
+        if match:
+            items.append((match.group(1), parse_select(match.group(2))))
+        elif part:
+            items.append(part)
+    return items
+
+
+def parse_filter(column: str, expression: str):
+    op, _, value = expression.partition(".")
+    negate = False
+    if op == "not":
+        negate = True
+        op, _, value = value.partition(".")
+    if op == "in":
+        value = [unquote(v) for v in split_top_level(value.strip("()"))]
+    else:
+        value = unquote(value)
+    return column, ("not." if negate else "") + op, value
+
+
+def parse_logic_tree(expression: str):
+    """or=(a.eq.1,and(b.gt.2,c.lt.3)) を条件木に変換する。"""
+    conditions = []
+    for part in split_top_level(expression.strip()[1:-1]):
+        part = part.strip()
+        match = re.fullmatch(r"(and|or)\((.*)\)", part)
+        if match:
+            conditions.append((match.group(1), parse_logic_tree("(" + match.group(2) + ")")[1]))
+        else:
+            column, _, rest = part.partition(".")
+            conditions.append(parse_filter(column, rest))
+    return "or", conditions
+
+
+def coerce(row_value, value):
+    if isinstance(row_value, bool):
+        return value == "true"
+    if isinstance(row_value, int):
+        return int(value)
+    if isinstance(row_value, float):
+        return float(value)
+    return value
+
+
+def matches(row, condition):
+    if len(condition) == 2:
+        kind, children = condition
+        results = (matches(row, child) for child in children)
+        return any(results) if kind == "or" else all(results)
+
+    column, op, value = condition
+    negate = op.startswith("not.")
+    op = op[4:] if negate else op
+    row_value = row.get(column)
+    if column in TIMESTAMP_COLUMNS and isinstance(value, str) and op in ("eq", "neq", "gt", "gte", "lt", "lte"):
+        value = normalize_timestamp(value)
+
+    if op == "is":
+        result = row_value is None if value == "null" else row_value == (value == "true")
+    elif op == "in":
+        result = row_value is not None and row_value in [coerce(row_value, v) for v in value]
+    elif row_value is None:
+        result = False
+    else:
+        value = coerce(row_value, value)
+        result = {
+            "eq": row_value == value, "neq": row_value != value,
+            "gt": row_value > value, "gte": row_value >= value,
+            "lt": row_value < value, "lte": row_value <= value,
+        }[op]
+    return not result if negate else result
+
+
+def apply_order(rows, order):
+    for part in reversed(split_top_level(order)):
+        column, *modifiers = part.split(".")
+        desc = "desc" in modifiers
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=desc)
+        nulls_first = "nullsfirst" in modifiers or (desc and "nullslast" not in modifiers)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+
+class Query:
+    """1つのテーブル（または埋め込みテーブル）に対する filter / order / limit の指定。"""
+
+    def __init__(self):
+        self.filters = []
+        self.order = None
+        self.limit = None
+        self.offset = 0
+
+    def run(self, db, table, rows=None):
+        if rows is None:
+            rows = db.candidates(table, [f for f in self.filters if len(f) == 3])
+        rows = [r for r in rows if all(matches(r, f) for f in self.filters)]
+        if self.order:
+            rows = apply_order(rows, self.order)
+        if self.offset:
+            rows = rows[self.offset:]
+        if self.limit is not None:
+            rows = rows[:self.limit]
+        return rows
+
+
+def parse_params(params):
+    """クエリパラメータを {埋め込みのパス: Query} に振り分ける（ルートのパスは ""）。"""
+    queries = {}
+    select = "*"
+    for key, value in params:
+        if key == "select":
+            select = value
+            continue
+        path, _, name = key.rpartition(".")
+        query = queries.setdefault(path, Query())
+        if name == "order":
+            query.order = value
+        elif name == "limit":
+            query.limit = int(value)
+        elif name == "offset":
+            query.offset = int(value)
+        elif name in ("or", "and"):
+            kind, conditions = parse_logic_tree(value)
+            query.filters.append((name, conditions))
+        elif name == "on_conflict":
+            continue
+        else:
+            query.filters.append(parse_filter(name, value))
+    return parse_select(select), queries
+
+
+def project(db, table, rows, select, queries, path=""):
+    result = []
+    for row in rows:
+        out = {}
+        for item in select:
+            if item == "*":
+                out.update(row)
+            elif isinstance(item, tuple):
+                child_table, child_select = item
+                child_path = f"{path}.{child_table}" if path else child_table
+                fk = FOREIGN_KEYS[table]
+                child_query = queries.get(child_path, Query())
+                children = child_query.run(
+                    db, child_table,
+                    [db.tables[child_table][k] for k in db.indexes[(child_table, fk)].get(row["id"], ())])
+                if child_select == ["count"]:
+                    out[child_table] = [{"count": len(children)}]
+                else:
+                    out[child_table] = project(db, child_table, children, child_select, queries, child_path)
+            else:
+                out[item] = row.get(item)
+        result.append(out)
+    return result
+
+
+# --- ストアドファンクション --------------------------------------------------
+
+def rpc_update_space_with_members(db, p_space_id, p_title=None, p_members_to_add=None,
+                                  p_members_to_delete=None, p_updated_at=None):
+    space = db.tables["spaces"].get(p_space_id)
+    if space is None:
+        return None
+    updated_at = normalize_timestamp(p_updated_at) if p_updated_at else now_iso()
+    if p_title is not None:
+        db.put("spaces", {**space, "title": p_title, "updated_at": updated_at})
+    if p_members_to_delete:
+        for key in list(db.indexes[("space_members", "space_id")].get(p_space_id, ())):
+            if db.tables["space_members"][key]["nickname"] in p_members_to_delete:
+                db.remove("space_members", key)
+    for nickname in p_members_to_add or []:
+        db.put("space_members", {"id": str(uuid.uuid4()), "space_id": p_space_id, "role": "editor",
+                                 "nickname": nickname, "created_at": updated_at})
+    members = [db.tables["space_members"][k] for k in db.indexes[("space_members", "space_id")].get(p_space_id, ())]
+    return {"space": db.tables["spaces"][p_space_id], "members": members}
+
+
+def rpc_goal_status_counts(db, p_space_id):
+    counts = Counter(db.tables["goals"][k]["status"] for k in db.indexes[("goals", "space_id")].get(p_space_id, ()))
+    return [{"status": status, "count": count} for status, count in counts.items()]
+
+
+def rpc_apply_goal_batch(db, p_space_id, p_ops, p_updated_at=None):
+    updated_at = normalize_timestamp(p_updated_at) if p_updated_at else now_iso()
+    for op in p_ops:
+        if op["op"] == "create":
+            db.put("goals", {
+                "id": op["goal_id"], "space_id": p_space_id, "title": op.get("title"), "detail": op.get("detail"),
+                "assignee": op.get("assignee"), "due_on": op.get("due_on"), "status": op.get("status", "todo"),
+                "tags": op.get("tags", []), "order_index": op.get("order_index", 0),
+                "created_at": updated_at, "updated_at": updated_at,
+            })
+    results = []
+    for op in p_ops:
+        if op["op"] == "create":
+            continue
+        goal = db.tables["goals"].get(op["goal_id"])
+        found = goal is not None and goal["space_id"] == p_space_id
+        if found:
+            changes = {"updated_at": updated_at}
+            if op["op"] == "close":
+                changes["status"] = "close"
+            elif op["op"] == "reorder":
+                changes["order_index"] = op["order_index"]
+            else:
+                changes.update({k: v for k, v in op.items() if k not in ("index", "op", "goal_id")})
+            db.put("goals", {**goal, **changes})
+        results.append({"index": op["index"], "goal_id": op["goal_id"], "found": found})
+    return results
+
+
+def rpc_reaction_summary(db, p_goal_id, p_author=None):
+    rows = [db.tables["reactions"][k] for k in db.indexes[("reactions", "goal_id")].get(p_goal_id, ())]
+    summary = {}
+    for row in sorted(rows, key=lambda r: r["created_at"]):
+        entry = summary.setdefault(row["emoji"], {"emoji": row["emoji"], "count": 0, "reacted": False})
+        entry["count"] += 1
+        entry["reacted"] = entry["reacted"] or row.get("author") == p_author
+    return sorted(summary.values(), key=lambda e: -e["count"])
+
+
+RPC_FUNCTIONS = {
+    "update_space_with_members": rpc_update_space_with_members,
+    "goal_status_counts": rpc_goal_status_counts,
+    "apply_goal_batch": rpc_apply_goal_batch,
+    "reaction_summary": rpc_reaction_summary,
+}
+
+
+def register_rpc(name):
+    """後から追加されるストアドファンクションのPython実装を登録するデコレーター。"""
+    def decorator(fn):
+        RPC_FUNCTIONS[name] = fn
+        return fn
+    return decorator
+
+
+# --- HTTPサーバー --------------------------------------------------------------
+
+class FakePostgrestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # ヘッダーとボディを別々に書き込むため、Nagleアルゴリズムと遅延ACKで1応答ごとに約40ms待たされるのを防ぐ
+    disable_nagle_algorithm = True
+    db: Database = None
+    latency: float = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, payload=None, headers=None):
+        body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _handle(self, method):
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(self.path)
+        segments = url.path.strip("/").split("/")
+        params = parse_qsl(url.query, keep_blank_values=True)
+        try:
+            body = self._body()
+            if segments[:2] != ["rest", "v1"] or len(segments) < 3:
+                raise PostgrestError(404, f"Unknown path: {url.path}")
+            with self.db.lock:
+                if segments[2] == "rpc":
+                    fn = RPC_FUNCTIONS.get(segments[3])
+                    if fn is None:
+                        raise PostgrestError(404, f"Unknown function: {segments[3]}")
+                    result = fn(self.db, **(body or {}))
+                else:
+                    result = self._table(method, segments[2], params, body)
+            status = 201 if method == "POST" and segments[2] != "rpc" else 200
+            if segments[2] != "rpc" and method != "GET" and "return=minimal" in self.headers.get("Prefer", ""):
+                result = None
+            self._respond(status, result)
+        except PostgrestError as e:
+            self._respond(e.status, {"message": e.message, "code": str(e.status), "hint": None, "details": None})
+        except Exception as e:
+            self._respond(400, {"message": str(e), "code": "400", "hint": None, "details": None})
+
+    def _table(self, method, table, params, body):
+        if table not in self.db.tables:
+            raise PostgrestError(404, f"Unknown table: {table}")
+        select, queries = parse_params(params)
+        query = queries.get("", Query())
+
+        if method == "GET":
+            rows = query.run(self.db, table)
+            return project(self.db, table, rows, select, queries)
+
+        if method == "POST":
+            rows = body if isinstance(body, list) else [body]
+            prefer = self.headers.get("Prefer", "")
+            written = []
+            for row in rows:
+                row = {k: normalize_timestamp(v) if k in TIMESTAMP_COLUMNS else v for k, v in row.items()}
+                row.setdefault("id", str(uuid.uuid4()))
+                existing = self.db.tables[table].get(self.db.key_of(table, row))
+                if existing is not None:
+                    if "ignore-duplicates" in prefer:
+                        continue
+                    if "merge-duplicates" not in prefer:
+                        raise PostgrestError(409, "duplicate key value violates unique constraint")
+                    row = {**existing, **row}
+                self.db.put(table, row)
+                written.append(row)
+            return written
+
+        rows = query.run(self.db, table)
+        if method == "PATCH":
+            changes = {k: normalize_timestamp(v) if k in TIMESTAMP_COLUMNS else v for k, v in (body or {}).items()}
+            updated = []
+            for row in rows:
+                new_row = {**row, **changes}
+                self.db.put(table, new_row)
+                updated.append(new_row)
+            return updated
+        if method == "DELETE":
+            for row in rows:
+                self.db.remove(table, self.db.key_of(table, row))
+            return rows
+        raise PostgrestError(405, f"Unsupported method: {method}")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def start_server(port: int = 0, latency: float = 0.0, db: Database = None):
+    """バックグラウンドスレッドでサーバーを起動し、(server, db) を返す。"""
+    db = db or Database()
+    handler = type("Handler", (FakePostgrestHandler,), {"db": db, "latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="1リクエストごとに加える疑似的なネットワーク遅延")
+    args = parser.parse_args()
+    server, _ = start_server(args.port, args.latency_ms / 1000)
+    print(f"fake PostgREST listening on http://127.0.0.1:{server.server_port}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
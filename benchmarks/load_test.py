@@ -0,0 +1,340 @@
+"""
+Todolis API の負荷試験・回帰検出用ベンチマーク。
+
+benchmarks/fake_postgrest.py をローカルのSupabase代替として起動し、
+SUPABASE_URL をそこへ向けた uvicorn main:app を別プロセスで立ち上げる。
+goals.csv のカラム構成に沿ったダミーデータ（スペース・目標・コメント・リアクション）を投入したうえで、
+読み取り・書き込みを混ぜたトラフィックを一定時間流し、エンドポイントごとの
+スループットと p50/p95/p99 レイテンシを出力する。
+
+実行方法:
+    python benchmarks/load_test.py --spaces 20 --goals-per-space 200 --duration 30 --concurrency 32
+    python benchmarks/load_test.py --output baseline.json
+    python benchmarks/load_test.py --compare baseline.json --threshold 0.2   # p95 が20%以上悪化したら終了コード1
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOALS_CSV = os.path.join(ROOT, "Todolis_API", "Todolis_API", "goals.csv")
+SUPABASE_KEY = "benchmark-key"
+EMOJIS = ["👍", "🎉", "❤️", "🔥", "👀", "🙏"]
+STATUSES = ["todo", "doing", "done", "close"]
+
+# (名前, 重み) — 実際の利用状況に合わせて読み取り中心の比率にしている
+TRAFFIC_MIX = [
+    ("GET space", 15),
+    ("GET goals list", 25),
+    ("GET goals list (page)", 5),
+    ("GET summary", 8),
+    ("GET dashboard", 5),
+    ("GET comments", 10),
+    ("GET reactions", 5),
+    ("GET reactions (summary)", 5),
+    ("POST goal", 5),
+    ("PUT goal", 7),
+    ("POST comment", 6),
+    ("POST reaction", 4),
+]
+
+
+def load_samples():
+    """goals.csv からタイトル・詳細・担当者・タグのサンプルを読み込む。"""
+    samples = {"title": [], "detail": [], "assignee": [], "tags": []}
+    try:
+        with open(GOALS_CSV, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                samples["title"].append(row["title"])
+                samples["detail"].append(row["detail"])
+                samples["assignee"].append(row["assignee"])
+                samples["tags"].append([t.strip() for t in row["tags"].split(",") if t.strip()])
+    except FileNotFoundError:
+        pass
+    if not samples["title"]:
+        samples = {"title": ["目標"], "detail": ["詳細"], "assignee": ["担当者"], "tags": [["タグ"]]}
+    return samples
+
+
+def generate_dataset(args, rng):
+    """goals.csv のスキーマに沿ったダミーデータを生成する。"""
+    samples = load_samples()
+    jst = timezone(timedelta(hours=+9))
+    base = datetime(2024, 1, 1, 9, tzinfo=jst)
+    data = {"spaces": [], "space_members": [], "goals": [], "comments": [], "reactions": []}
+    for s in range(args.spaces):
+        space_id = str(uuid.uuid4())
+        created = base + timedelta(minutes=s)
+        data["spaces"].append({
+            "id": space_id, "title": f"ベンチマーク用スペース{s}", "view_token": str(uuid.uuid4()),
+            "edit_token": str(uuid.uuid4()), "created_at": created.isoformat(), "updated_at": created.isoformat(),
+        })
+        for nickname in sorted(set(samples["assignee"]))[:args.members_per_space]:
+            data["space_members"].append({
+                "id": str(uuid.uuid4()), "space_id": space_id, "role": "editor",
+                "nickname": nickname, "created_at": created.isoformat(),
+            })
+        for g in range(args.goals_per_space):
+            goal_id = str(uuid.uuid4())
+            i = rng.randrange(len(samples["title"]))
+            goal_created = created + timedelta(minutes=g)
+            data["goals"].append({
+                "id": goal_id, "space_id": space_id, "title": samples["title"][i], "detail": samples["detail"][i],
+                "assignee": rng.choice(samples["assignee"]), "status": rng.choice(STATUSES),
+                "due_on": (date(2024, 1, 15) + timedelta(days=rng.randrange(120))).isoformat(),
+                "tags": samples["tags"][i], "order_index": g + 1,
+                "created_at": goal_created.isoformat(), "updated_at": goal_created.isoformat(),
+            })
+            for c in range(args.comments_per_goal):
+                data["comments"].append({
+                    "id": str(uuid.uuid4()), "goal_id": goal_id, "author": rng.choice(samples["assignee"]),
+                    "body": f"コメント{c}", "created_at": (goal_created + timedelta(seconds=c + 1)).isoformat(),
+                })
+            for r in range(args.reactions_per_goal):
+                data["reactions"].append({
+                    "id": str(uuid.uuid4()), "goal_id": goal_id, "author": rng.choice(samples["assignee"]),
+                    "emoji": rng.choice(EMOJIS), "created_at": (goal_created + timedelta(seconds=r + 1)).isoformat(),
+                })
+    return data
+
+
+def seed(supabase_url, data, chunk_size=1000):
+    """PostgRESTの一括insertでデータを投入する（実際のローカルSupabaseに対しても使える）。"""
+    headers = {"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}", "Prefer": "return=minimal"}
+    with httpx.Client(base_url=f"{supabase_url}/rest/v1", headers=headers, timeout=60) as client:
+        for name in ("spaces", "space_members", "goals", "comments", "reactions"):
+            rows = data[name]
+            for start in range(0, len(rows), chunk_size):
+                client.post(f"/{name}", json=rows[start:start + chunk_size]).raise_for_status()
+
+
+def wait_until_ready(url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} の起動に失敗しました (exit code {process.returncode})")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} が {timeout} 秒以内に起動しませんでした")
+
+
+class Workload:
+    """投入済みデータをもとに、重み付きでランダムなリクエストを組み立てる。"""
+
+    def __init__(self, data, rng):
+        self.rng = rng
+        self.space_ids = [s["id"] for s in data["spaces"]]
+        self.goals = [(g["id"], g["space_id"]) for g in data["goals"]]
+        self.assignees = sorted({g["assignee"] for g in data["goals"]}) or ["担当者"]
+        self.names = [name for name, _ in TRAFFIC_MIX]
+        self.weights = [weight for _, weight in TRAFFIC_MIX]
+
+    def next_request(self):
+        """(エンドポイント名, method, path, params, json) を返す。"""
+        rng = self.rng
+        name = rng.choices(self.names, self.weights)[0]
+        space_id = rng.choice(self.space_ids)
+        goal_id, _ = rng.choice(self.goals)
+        author = rng.choice(self.assignees)
+        if name == "GET space":
+            return name, "GET", f"/api/spaces/{space_id}/get/", None, None
+        if name == "GET goals list":
+            return name, "GET", f"/api/goals/list/{space_id}/get/", None, None
+        if name == "GET goals list (page)":
+            return name, "GET", f"/api/goals/list/{space_id}/get/", {"limit": 50}, None
+        if name == "GET summary":
+            return name, "GET", f"/api/spaces/{space_id}/summary/get/", None, None
+        if name == "GET dashboard":
+            return name, "GET", f"/api/spaces/{space_id}/dashboard", None, None
+        if name == "GET comments":
+            return name, "GET", f"/api/goals/{goal_id}/comments/get/", None, None
+        if name == "GET reactions":
+            return name, "GET", f"/api/goals/{goal_id}/reactions/get/", None, None
+        if name == "GET reactions (summary)":
+            return name, "GET", f"/api/goals/{goal_id}/reactions/get/", {"mode": "summary", "author": author}, None
+        if name == "POST goal":
+            params = {"title": "負荷試験で追加した目標", "detail": "ベンチマーク", "assignee": author,
+                      "due_on": (date(2024, 2, 1) + timedelta(days=rng.randrange(60))).isoformat()}
+            return name, "POST", f"/api/goals/{space_id}/add/", params, None
+        if name == "PUT goal":
+            return name, "PUT", f"/api/goals/{goal_id}/update/", {"status": rng.choice(STATUSES[:3])}, None
+        if name == "POST comment":
+            return name, "POST", f"/api/goals/{goal_id}/comments/add/", None, {"author": author, "body": "負荷試験コメント"}
+        return name, "POST", f"/api/goals/{goal_id}/reactions/add/", None, {"author": author, "emoji": rng.choice(EMOJIS)}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+async def run_traffic(base_url, workload, duration, concurrency, warmup):
+    """concurrency 本の仮想ユーザーで duration 秒間リクエストを送り続け、レイテンシを集計する。"""
+    samples = {}
+    errors = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        measure_from = started + warmup
+        stop_at = measure_from + duration
+
+        async def user():
+            while True:
+                now = time.perf_counter()
+                if now >= stop_at:
+                    return
+                name, method, path, params, body = workload.next_request()
+                t0 = time.perf_counter()
+                try:
+                    res = await client.request(method, path, params=params, json=body)
+                    failed = res.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                elapsed = time.perf_counter() - t0
+                if t0 < measure_from:
+                    continue
+                samples.setdefault(name, []).append(elapsed)
+                if failed:
+                    errors[name] = errors.get(name, 0) + 1
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+
+    report = {"duration": duration, "concurrency": concurrency, "endpoints": {}}
+    total = 0
+    for name in workload.names:
+        values = sorted(samples.get(name, []))
+        total += len(values)
+        report["endpoints"][name] = {
+            "requests": len(values),
+            "errors": errors.get(name, 0),
+            "throughput": round(len(values) / duration, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+        }
+    report["total_requests"] = total
+    report["total_errors"] = sum(errors.values())
+    report["throughput"] = round(total / duration, 2)
+    return report
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<26}{'reqs':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:<26}{row['requests']:>8}{row['errors']:>8}{row['throughput']:>10}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    print(f"\ntotal: {report['total_requests']} requests, {report['total_errors']} errors, "
+          f"{report['throughput']} req/s (concurrency {report['concurrency']}, {report['duration']}s)")
+
+
+def compare_reports(baseline, report, threshold):
+    """ベースラインと比べて p95 またはスループットが threshold 以上悪化したエンドポイントを返す。"""
+    regressions = []
+    for name, row in report["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base or not base["requests"] or not row["requests"]:
+            continue
+        if base["p95_ms"] and row["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {row['p95_ms']}ms")
+        if row["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['throughput']} -> {row['throughput']} req/s")
+        if row["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {row['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spaces", type=int, default=20)
+    parser.add_argument("--goals-per-space", type=int, default=200)
+    parser.add_argument("--members-per-space", type=int, default=5)
+    parser.add_argument("--comments-per-goal", type=int, default=3)
+    parser.add_argument("--reactions-per-goal", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=30.0, help="計測時間（秒）")
+    parser.add_argument("--warmup", type=float, default=3.0, help="計測前のウォームアップ時間（秒）")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn のワーカー数")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="fake PostgREST に加える疑似遅延")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--supabase-port", type=int, default=54329)
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="APIプロセスに渡す追加の環境変数（例: TODOLIS_CACHE_BACKEND=sqlite）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    parser.add_argument("--compare", help="比較対象となるベースラインのJSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回帰とみなす悪化率")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    supabase_url = f"http://127.0.0.1:{args.supabase_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    processes = []
+    try:
+        fake = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "fake_postgrest.py"),
+             "--port", str(args.supabase_port), "--latency-ms", str(args.latency_ms)],
+            stdout=subprocess.DEVNULL)
+        processes.append(fake)
+        wait_until_ready(supabase_url, fake)
+
+        data = generate_dataset(args, rng)
+        t0 = time.perf_counter()
+        seed(supabase_url, data)
+        print(f"seeded {len(data['spaces'])} spaces, {len(data['goals'])} goals, "
+              f"{len(data['comments'])} comments, {len(data['reactions'])} reactions "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+        env = dict(os.environ, SUPABASE_URL=supabase_url, SUPABASE_KEY=SUPABASE_KEY)
+        env.update(item.split("=", 1) for item in args.app_env)
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=ROOT, env=env)
+        processes.append(app)
+        wait_until_ready(app_url, app)
+
+        report = asyncio.run(run_traffic(app_url, Workload(data, rng), args.duration, args.concurrency, args.warmup))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report["dataset"] = {name: len(rows) for name, rows in data.items()}
+    report["app_env"] = args.app_env
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_reports(json.load(f), report, args.threshold)
+        if regressions:
+            print("\nregressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nno regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
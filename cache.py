@@ -0,0 +1,411 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+logger = logging.getLogger("uvicorn.error")
+
+# キャッシュの最大件数とTTL（秒）。環境変数で変更可能
+CACHE_MAX_ENTRIES = int(os.getenv("TODOLIS_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("TODOLIS_CACHE_TTL_SECONDS", "30"))
+# キャッシュの保存先: memory（ワーカーごと）, sqlite（同一マシン上の全ワーカーで共有）, redis
+CACHE_BACKEND = os.getenv("TODOLIS_CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.getenv("TODOLIS_CACHE_PATH", os.path.join(tempfile.gettempdir(), "todolis-cache.sqlite3"))
+CACHE_REDIS_URL = os.getenv("TODOLIS_REDIS_URL", "redis://localhost:6379/0")
+# Redisへの接続・応答を待つ最大秒数（障害時にスレッドが詰まらないように短くする）
+CACHE_REDIS_TIMEOUT_SECONDS = float(os.getenv("TODOLIS_REDIS_TIMEOUT_SECONDS", "0.5"))
+# SQLiteバックエンドで期限切れ・件数超過のエントリを削除する間隔（秒）
+CACHE_PRUNE_SECONDS = float(os.getenv("TODOLIS_CACHE_PRUNE_SECONDS", "10"))
+
+
+class CacheBackend:
+    """
+    キャッシュの保存先の共通インターフェース。
+    各エントリはグループ (space_id など) に紐づけて登録でき、グループ単位でまとめて無効化できる。
+    キーと値はJSONに変換できる必要がある（共有バックエンドではJSONで保存するため）。
+
+    非同期のハンドラーからは aget / aset / ainvalidate / astats を使う。
+    ファイルやネットワークのI/Oを伴うバックエンド (blocking = True) はスレッドで実行してイベントループを止めず、
+    バックエンドの障害は警告ログを出したうえでキャッシュミス（無効化・登録は失敗）として扱う。
+    """
+
+    # I/Oを伴い、イベントループ上で直接呼び出してはいけないバックエンドは True
+    blocking = False
+    errors = 0
+
+    async def _call(self, fn: Callable, *args) -> Any:
+        try:
+            if self.blocking:
+                return await asyncio.to_thread(fn, *args)
+            return fn(*args)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache backend {type(self).__name__}.{fn.__name__} failed: {e}")
+            return None
+
+    async def aget(self, key: Hashable) -> Optional[Any]:
+        return await self._call(self.get, key)
+
+    async def aset(self, key: Hashable, value: Any, group: Optional[Hashable] = None) -> None:
+        await self._call(self.set, key, value, group)
+
+    async def asetdefault(self, key: Hashable, value: Any) -> Optional[Any]:
+        return await self._call(self.setdefault, key, value)
+
+    async def ainvalidate(self, group: Hashable) -> None:
+        await self._call(self.invalidate, group)
+
+    async def astats(self) -> dict:
+        stats = await self._call(self.stats)
+        if stats is None:
+            return {"backend": type(self).__name__, "errors": self.errors}
+        return {**stats, "errors": self.errors}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """キャッシュされた値を返す。存在しないか期限切れの場合は None を返す。"""
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, group: Optional[Hashable] = None) -> None:
+        """値を登録する。"""
+        raise NotImplementedError
+
+    def setdefault(self, key: Hashable, value: Any) -> Any:
+        """キーが無い（期限切れを含む）場合だけ value を登録し、登録済みの値を返す。同時に呼ばれても値は1つに決まる。"""
+        raise NotImplementedError
+
+    def invalidate(self, group: Hashable) -> None:
+        """グループに紐づくエントリをすべて削除する。"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    ワーカープロセス内で共有する、TTL付きのLRUキャッシュ。
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (有効期限, グループ, 値)
+        self._groups: Dict[Hashable, Set[Hashable]] = {}
+        # setdefault から set を呼ぶため再入可能なロックにする
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, group, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, group: Optional[Hashable] = None) -> None:
+        """値を登録する。最大件数を超えた場合は最も古く使われたエントリを追い出す。"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, group, value)
+            if group is not None:
+                self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def setdefault(self, key: Hashable, value: Any) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return entry[2]
+            self.set(key, value)
+            return value
+
+    def invalidate(self, group: Hashable) -> None:
+        """グループに紐づくエントリをすべて削除する。"""
+        with self._lock:
+            for key in self._groups.pop(group, set()):
+                self._entries.pop(key, None)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, group, _ = self._entries.pop(key)
+        if group is not None:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    SQLiteファイルに保存するキャッシュ。同一マシン上のgunicornワーカー間で共有され、
+    どのワーカーで行った無効化も全ワーカーに即座に反映される。
+    期限切れのエントリの削除と件数超過時の追い出し（最終アクセス日時の古い順）は、set のたびではなく
+    prune_interval 秒ごとにまとめて行う（その間は max_entries を一時的に超えうる）。
+    ヒット数などの統計はワーカーごとに集計する。
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, max_entries: int = CACHE_MAX_ENTRIES,
+                 ttl: float = CACHE_TTL_SECONDS, table: str = "cache_entries",
+                 prune_interval: float = CACHE_PRUNE_SECONDS):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._last_prune = time.monotonic()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY, grp TEXT, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_grp ON {self.table} (grp)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed_at ON {self.table} (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3の接続はスレッドをまたいで使えないため、スレッドごとに接続を持つ
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            f"SELECT value FROM {self.table} WHERE key = ? AND expires_at >= ?",
+            (_encode_key(key), now),
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, _encode_key(key)))
+        self._count("hits")
+        return json.loads(row[0])
+
+    def set(self, key: Hashable, value: Any, group: Optional[Hashable] = None) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, grp, value, expires_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (_encode_key(key), None if group is None else _encode_key(group),
+             json.dumps(value, ensure_ascii=False), now + self.ttl, now),
+        )
+        with self._lock:
+            due = time.monotonic() - self._last_prune >= self.prune_interval
+            if due:
+                self._last_prune = time.monotonic()
+        if due:
+            self.prune()
+
+    def prune(self) -> None:
+        """期限切れのエントリを削除し、それでも最大件数を超える場合は最終アクセスの古い順に追い出す。"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        overflow = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN"
+                f" (SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+            self._count("evictions", overflow)
+
+    def setdefault(self, key: Hashable, value: Any) -> Any:
+        conn = self._connect()
+        now = time.time()
+        encoded = json.dumps(value, ensure_ascii=False)
+        # 既存の行が期限切れの場合だけ上書きし、その後の SELECT で確定した値を読む
+        conn.execute(
+            f"INSERT INTO {self.table} (key, grp, value, expires_at, accessed_at) VALUES (?, NULL, ?, ?, ?)"
+            f" ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at,"
+            f" accessed_at = excluded.accessed_at WHERE {self.table}.expires_at < ?",
+            (_encode_key(key), encoded, now + self.ttl, now, now),
+        )
+        row = conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (_encode_key(key),)).fetchone()
+        return json.loads(row[0]) if row is not None else value
+
+    def invalidate(self, group: Hashable) -> None:
+        cur = self._connect().execute(f"DELETE FROM {self.table} WHERE grp = ?", (_encode_key(group),))
+        self._count("invalidations", cur.rowcount)
+
+    def clear(self) -> None:
+        self._connect().execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        entries = self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Redis（またはRedis互換サーバー）に保存するキャッシュ。複数マシンのワーカー間で共有される。
+    TTLはRedisの有効期限で、件数の上限はRedis側の maxmemory-policy で管理する。
+    グループに属するキーはRedisのセットで管理し、無効化時にまとめて削除する。
+    """
+
+    blocking = True
+
+    def __init__(self, url: str = CACHE_REDIS_URL, ttl: float = CACHE_TTL_SECONDS, prefix: str = "todolis:cache:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("TODOLIS_CACHE_BACKEND=redis を使用するには redis パッケージが必要です")
+        self._redis = redis.Redis.from_url(url, socket_timeout=CACHE_REDIS_TIMEOUT_SECONDS,
+                                           socket_connect_timeout=CACHE_REDIS_TIMEOUT_SECONDS)
+        self.url = url
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        raw = self._redis.get(self.prefix + _encode_key(key))
+        if raw is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(raw)
+
+    def set(self, key: Hashable, value: Any, group: Optional[Hashable] = None) -> None:
+        redis_key = self.prefix + _encode_key(key)
+        ttl_ms = int(self.ttl * 1000)
+        pipe = self._redis.pipeline()
+        pipe.set(redis_key, json.dumps(value, ensure_ascii=False), px=ttl_ms)
+        if group is not None:
+            group_key = self.prefix + "group:" + _encode_key(group)
+            pipe.sadd(group_key, redis_key)
+            pipe.pexpire(group_key, ttl_ms)
+        pipe.execute()
+
+    def setdefault(self, key: Hashable, value: Any) -> Any:
+        redis_key = self.prefix + _encode_key(key)
+        if self._redis.set(redis_key, json.dumps(value, ensure_ascii=False), px=int(self.ttl * 1000), nx=True):
+            return value
+        raw = self._redis.get(redis_key)
+        return json.loads(raw) if raw is not None else value
+
+    def invalidate(self, group: Hashable) -> None:
+        group_key = self.prefix + "group:" + _encode_key(group)
+        keys = self._redis.smembers(group_key)
+        if keys:
+            self._redis.delete(*keys)
+        self._redis.delete(group_key)
+        self._count("invalidations", len(keys))
+
+    def clear(self) -> None:
+        keys = list(self._redis.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self._redis.delete(*keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "redis",
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+def _encode_key(key: Hashable) -> str:
+    """タプルなどのキーを共有バックエンドで使える文字列に変換する。"""
+    if isinstance(key, str):
+        return key
+    return json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+
+
+def create_cache_backend(namespace: str = "cache", max_entries: int = CACHE_MAX_ENTRIES,
+                         ttl: float = CACHE_TTL_SECONDS, name: str = CACHE_BACKEND) -> CacheBackend:
+    """
+    環境変数 TODOLIS_CACHE_BACKEND で指定されたキャッシュバックエンドを生成する。
+    namespace ごとに共有バックエンド上の保存領域（SQLiteのテーブル・Redisのキー接頭辞）を分ける。
+    """
+    if name == "memory":
+        return MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+    if name == "sqlite":
+        return SQLiteCacheBackend(max_entries=max_entries, ttl=ttl, table=f"{namespace}_entries")
+    if name == "redis":
+        return RedisCacheBackend(ttl=ttl, prefix=f"todolis:{namespace}:")
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+# スペース詳細・目標一覧のキャッシュ（space_id 単位で無効化する）
+space_cache = create_cache_backend()
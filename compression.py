@@ -0,0 +1,202 @@
+import os
+import zlib
+from typing import Dict, Optional
+
+# brotli（または brotlicffi）がインストールされていれば br も使う
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli は任意の依存
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# この値より小さいレスポンスは圧縮しない（バイト）
+COMPRESSION_MIN_SIZE = int(os.getenv("TODOLIS_COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("TODOLIS_COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("TODOLIS_COMPRESSION_BROTLI_QUALITY", "4"))
+# 1つのボディをこのサイズごとに区切って圧縮・送信する（圧縮後のボディ全体をメモリ上に作らない）
+COMPRESSION_CHUNK_SIZE = int(os.getenv("TODOLIS_COMPRESSION_CHUNK_SIZE", str(64 * 1024)))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html")
+# ストリーミング中にまとめて送られると困るため、圧縮しないContent-Type
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+class _GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        # チャンクごとに SYNC_FLUSH して、クライアントが受け取った分から展開できるようにする
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding の q値を考慮して br / gzip のどちらを使うかを返す。使えなければ None。"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=lambda name: accepted.get(name, wildcard))
+    return best if accepted.get(best, wildcard) > 0 else None
+
+
+def add_vary(headers: list) -> list:
+    """Vary ヘッダーに Accept-Encoding を加える。既存の Vary は1つのヘッダーにまとめる。"""
+    values = []
+    others = []
+    for key, value in headers:
+        if key.lower() == b"vary":
+            values.extend(v.strip() for v in value.decode("latin-1").split(",") if v.strip())
+        else:
+            others.append((key, value))
+    if not any(v == "*" or v.lower() == "accept-encoding" for v in values):
+        values.append("Accept-Encoding")
+    return others + [(b"vary", ", ".join(values).encode("latin-1"))]
+
+
+class CompressionMiddleware:
+    """
+    gzip / brotli でレスポンスを圧縮するASGIミドルウェア。
+    - minimum_size 未満のレスポンスは圧縮しない（ストリーミングの場合は minimum_size に達するまで先頭をバッファする）
+    - routes にルートのパス（例: "/api/goals/list/{space_id}/get/"）ごとの minimum_size を指定できる。None で圧縮しない
+    - ボディは chunk_size ごとに圧縮して送信するため、大きな一覧でも圧縮後のボディ全体をメモリ上に保持しない
+    圧縮したレスポンスのETagは、エンコーディングによって内容が変わるため弱いETag (W/) に変換する。
+    圧縮の対象になりうるレスポンスには、実際に圧縮したかどうかにかかわらず Vary: Accept-Encoding を付け、
+    共有キャッシュが圧縮した内容を圧縮を受け付けないクライアントに返さないようにする。
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, routes: Optional[Dict[str, Optional[int]]] = None,
+                 gzip_level: int = COMPRESSION_GZIP_LEVEL, brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+                 chunk_size: int = COMPRESSION_CHUNK_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.routes = routes or {}
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.chunk_size = chunk_size
+
+    def _encoder(self, encoding: str):
+        if encoding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+    def _minimum_size_for(self, scope) -> Optional[int]:
+        route = scope.get("route")
+        path = getattr(route, "path", None)
+        if path in self.routes:
+            return self.routes[path]
+        return self.minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+
+        start_message = None
+        buffer = []
+        buffered = 0
+        encoder = None
+        passthrough = False
+        minimum_size = self.minimum_size
+
+        async def send_compressed(data: bytes, more_body: bool):
+            # chunk_size ごとに圧縮して送る
+            for offset in range(0, len(data), self.chunk_size):
+                compressed = encoder.compress(data[offset:offset + self.chunk_size])
+                if compressed:
+                    await send({"type": "http.response.body", "body": compressed, "more_body": True})
+            if not more_body:
+                await send({"type": "http.response.body", "body": encoder.finish(), "more_body": False})
+
+        async def start_compression():
+            nonlocal encoder
+            encoder = self._encoder(encoding)
+            headers = []
+            for key, value in start_message.get("headers", []):
+                if key == b"content-length":
+                    continue
+                if key == b"etag" and not value.startswith(b"W/"):
+                    value = b"W/" + value
+                headers.append((key, value))
+            headers.append((b"content-encoding", encoding.encode()))
+            await send({**start_message, "headers": headers})
+
+        async def send_wrapper(message):
+            nonlocal start_message, buffered, passthrough, minimum_size
+            if message["type"] == "http.response.start":
+                headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip()
+                minimum_size = self._minimum_size_for(scope)
+                if (minimum_size is None or message["status"] < 200 or message["status"] in (204, 304)
+                        or b"content-encoding" in headers or content_type in EXCLUDED_TYPES
+                        or content_type not in COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = {**message, "headers": add_vary(message.get("headers", []))}
+                if encoding is None:
+                    passthrough = True
+                    await send(start_message)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is not None:
+                await send_compressed(body, more_body)
+                return
+
+            buffer.append(body)
+            buffered += len(body)
+            if more_body and buffered < minimum_size:
+                return
+            data = b"".join(buffer)
+            buffer.clear()
+            if not more_body and buffered < minimum_size:
+                # 小さいレスポンスはそのまま送る
+                passthrough = True
+                await send(start_message)
+                await send({"type": "http.response.body", "body": data, "more_body": False})
+                return
+            await start_compression()
+            await send_compressed(data, more_body)
+
+        await self.app(scope, receive, send_wrapper)
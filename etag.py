@@ -0,0 +1,140 @@
+import hashlib
+import os
+import uuid
+from typing import Optional
+
+from fastapi import Request, Response
+
+from cache import CACHE_BACKEND, CACHE_TTL_SECONDS, create_cache_backend
+
+# バージョントークンの保持期間（秒）。期限切れ後は新しいトークンが発行され、クライアントは再取得するだけになる
+VERSION_TTL_SECONDS = float(os.getenv("TODOLIS_VERSION_TTL_SECONDS", "86400"))
+VERSION_MAX_ENTRIES = int(os.getenv("TODOLIS_VERSION_MAX_ENTRIES", "100000"))
+# ETagの元にするもの: version（バージョントークン）, content（レスポンスの内容のハッシュ）, auto
+# auto はバージョンを全ワーカーで共有できる場合 (TODOLIS_CACHE_BACKEND が sqlite / redis) だけ version を使う。
+# memory のバージョンはワーカーごとなので、他のワーカーで行われた書き込みを知らずに 304 を返してしまう。
+# ワーカーが1つだけの構成では version を指定すると、Supabaseを読まずに 304 を返せる。
+ETAG_SOURCE = os.getenv("TODOLIS_ETAG_SOURCE", "auto")
+VERSION_ETAGS = ETAG_SOURCE == "version" or (ETAG_SOURCE == "auto" and CACHE_BACKEND != "memory")
+
+# バージョントークンが実際に保持される秒数。
+# ETagに使わない場合（memory）はワーカーごとのトークンで他のワーカーの書き込みを知らないため、
+# ワーカー内のキャッシュのキーにだけ使い、キャッシュのTTLより長く保持しない。
+VERSION_LIFETIME_SECONDS = VERSION_TTL_SECONDS if VERSION_ETAGS else min(VERSION_TTL_SECONDS, CACHE_TTL_SECONDS)
+
+# スペース・目標ごとのバージョントークン。書き込みのたびに新しいランダム値に置き換える。
+# キャッシュと同じバックエンドに保存するため、共有バックエンドなら全ワーカーで一致する。
+version_store = create_cache_backend(namespace="versions", max_entries=VERSION_MAX_ENTRIES,
+                                     ttl=VERSION_LIFETIME_SECONDS)
+
+
+def space_scope(space_id: str) -> str:
+    return f"space:{space_id}"
+
+
+def goal_scope(goal_id: str) -> str:
+    return f"goal:{goal_id}"
+
+
+async def current_version(scope: str) -> str:
+    """
+    スコープの現在のバージョントークンを返す。まだ無い場合は新しく発行する。
+    保存先に障害がある場合は毎回新しいトークンになるため、304 やキャッシュは使われなくなるが古い内容は返さない。
+    """
+    version = await version_store.aget(scope)
+    if version is None:
+        # 同時に初回の読み取りが来ても、最初に登録されたトークンに揃える
+        version = await version_store.asetdefault(scope, uuid.uuid4().hex) or uuid.uuid4().hex
+    return version
+
+
+async def bump_version(scope: str) -> None:
+    """書き込み時に呼び出し、スコープのバージョントークンを更新する。"""
+    await version_store.aset(scope, uuid.uuid4().hex)
+
+
+def make_etag(version: str, *parts) -> str:
+    """
+    バージョントークンとリクエストの内容（エンドポイント名やクエリパラメータ）から強いETagを作る。
+    データを取得する前にバージョンを読むことで、取得中に書き込みがあっても古いETagが新しい内容に付くことはない。
+    """
+    digest = hashlib.sha1(repr((version,) + parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match は弱い比較を行うため W/ 接頭辞は無視する
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """
+    If-None-Match がETagと一致する場合は 304 Not Modified のレスポンスを返す。
+    バージョンをETagに使わない場合は常に None を返し、ContentETagMiddleware が内容から判定する。
+    """
+    if not VERSION_ETAGS:
+        return None
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    # キャッシュしたレスポンスは毎回再検証させる
+    response.headers["Cache-Control"] = "no-cache"
+
+
+class ContentETagMiddleware:
+    """
+    バージョンをETagに使わない場合 (VERSION_ETAGS = False) に、ETagを付けた GET / HEAD の 200 レスポンスの
+    ETagをボディのハッシュに置き換え、If-None-Match と一致すれば 304 を返すASGIミドルウェア。
+    Supabaseへの問い合わせは省けないが、どのワーカーが応答しても内容が同じなら同じETagになる。
+    圧縮でボディが変わる前に計算するため、CompressionMiddleware より内側に追加する。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = ""
+        for key, value in scope.get("headers", []):
+            if key == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+        start_message = None
+        chunks = []
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                if message["status"] == 200 and any(key.lower() == b"etag" for key, _ in headers):
+                    start_message = message
+                    return
+            if start_message is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            headers = [(key, value) for key, value in start_message["headers"] if key.lower() != b"etag"]
+            headers.append((b"etag", etag.encode()))
+            if if_none_match and etag_matches(if_none_match, etag):
+                headers = [(key, value) for key, value in headers
+                           if key.lower() not in (b"content-length", b"content-type")]
+                await send({**start_message, "status": 304, "headers": headers})
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
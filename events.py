@@ -0,0 +1,465 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from cache import CACHE_BACKEND, CACHE_REDIS_TIMEOUT_SECONDS, CACHE_REDIS_URL, CACHE_SQLITE_PATH
+
+logger = logging.getLogger("uvicorn.error")
+
+# スペースごとに保持する直近のイベント数（再接続時の再送に使う）
+EVENT_HISTORY_SIZE = int(os.getenv("TODOLIS_EVENT_HISTORY_SIZE", "256"))
+# 履歴を保持するスペース数の上限。超えた場合は購読者のいないスペースから最後の更新が古い順に捨てる
+EVENT_MAX_SPACES = int(os.getenv("TODOLIS_EVENT_MAX_SPACES", "1024"))
+# 購読者ごとの未送信イベントの上限。超えた購読者には reset を送って切断する
+EVENT_QUEUE_SIZE = int(os.getenv("TODOLIS_EVENT_QUEUE_SIZE", "100"))
+# 接続維持のためのコメント行を送る間隔（秒）
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("TODOLIS_EVENT_HEARTBEAT_SECONDS", "15"))
+# イベントの受け渡し先: memory（ワーカープロセス内のみ。1ワーカー専用）, sqlite（同一マシン上の全ワーカー）, redis
+# 既定ではキャッシュと同じ共有バックエンドを使う
+EVENT_BACKEND = os.getenv("TODOLIS_EVENT_BACKEND", CACHE_BACKEND)
+# 共有ログから他のワーカーのイベントを読み込む間隔（秒）
+EVENT_POLL_SECONDS = float(os.getenv("TODOLIS_EVENT_POLL_SECONDS", "0.2"))
+# 共有ログに残すイベントの期間（秒, sqlite）と件数（redis）
+EVENT_LOG_RETENTION_SECONDS = float(os.getenv("TODOLIS_EVENT_LOG_RETENTION_SECONDS", "3600"))
+EVENT_LOG_MAX_LENGTH = int(os.getenv("TODOLIS_EVENT_LOG_MAX_LENGTH", "100000"))
+# 共有ログへの書き込みを待つイベント数の上限（ログに書けない間に溜め込まない）
+EVENT_OUTBOX_SIZE = int(os.getenv("TODOLIS_EVENT_OUTBOX_SIZE", "10000"))
+# memory の場合に、同じマシンで他のワーカーが動いていないかを確かめるロックファイルの置き場所
+EVENT_LOCK_DIR = os.getenv("TODOLIS_EVENT_LOCK_DIR", os.path.join(tempfile.gettempdir(), "todolis-events"))
+
+_POLL_BATCH = 1000
+_PRUNE_INTERVAL_SECONDS = 60
+
+
+class SQLiteEventLog:
+    """
+    SQLiteファイルのテーブルに追記する共有イベントログ（既定ではキャッシュと同じファイル）。
+    連番 (seq) は書き込みの確定順に増えるため、各ワーカーは最後に読んだ連番より後の行を読めばよい。
+    """
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, retention: float = EVENT_LOG_RETENTION_SECONDS):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS space_events ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, space_id TEXT NOT NULL, event_type TEXT NOT NULL,"
+            " data TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS space_events_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3の接続はスレッドをまたいで使えないため、スレッドごとに接続を持つ
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def log_id(self) -> str:
+        """ログを作り直すと変わるID。イベントIDに含め、作り直す前のIDからの再開を防ぐ。"""
+        conn = self._connect()
+        conn.execute("INSERT OR IGNORE INTO space_events_meta (key, value) VALUES ('log_id', ?)", (uuid.uuid4().hex[:8],))
+        return conn.execute("SELECT value FROM space_events_meta WHERE key = 'log_id'").fetchone()[0]
+
+    def tail(self) -> int:
+        return self._connect().execute("SELECT coalesce(max(seq), 0) FROM space_events").fetchone()[0]
+
+    def append(self, events: List[Tuple[str, str, str]]) -> None:
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.executemany("INSERT INTO space_events (space_id, event_type, data, created_at) VALUES (?, ?, ?, ?)",
+                             [(space_id, event_type, data, now) for space_id, event_type, data in events])
+
+    def read_after(self, seq: int, limit: int) -> List[Tuple[int, str, str, str]]:
+        return self._connect().execute(
+            "SELECT seq, space_id, event_type, data FROM space_events WHERE seq > ? ORDER BY seq LIMIT ?",
+            (seq, limit),
+        ).fetchall()
+
+    def prune(self) -> None:
+        self._connect().execute("DELETE FROM space_events WHERE created_at < ?", (time.time() - self.retention,))
+
+
+class RedisEventLog:
+    """
+    Redis Streams に追記する共有イベントログ。複数マシンのワーカー間で共有される。
+    ストリームのID（ミリ秒-連番）を1つの整数に詰めて連番として扱う。
+    """
+
+    def __init__(self, url: str = CACHE_REDIS_URL, max_length: int = EVENT_LOG_MAX_LENGTH,
+                 key: str = "todolis:events"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("TODOLIS_EVENT_BACKEND=redis を使用するには redis パッケージが必要です")
+        self._redis = redis.Redis.from_url(url, socket_timeout=CACHE_REDIS_TIMEOUT_SECONDS,
+                                           socket_connect_timeout=CACHE_REDIS_TIMEOUT_SECONDS)
+        self.max_length = max_length
+        self.key = key
+
+    @staticmethod
+    def _to_seq(stream_id) -> int:
+        ms, _, n = (stream_id.decode() if isinstance(stream_id, bytes) else stream_id).partition("-")
+        return (int(ms) << 20) | int(n or 0)
+
+    @staticmethod
+    def _to_stream_id(seq: int) -> str:
+        return f"{seq >> 20}-{seq & 0xFFFFF}"
+
+    def log_id(self) -> str:
+        self._redis.set(self.key + ":log_id", uuid.uuid4().hex[:8], nx=True)
+        return self._redis.get(self.key + ":log_id").decode()
+
+    def tail(self) -> int:
+        last = self._redis.xrevrange(self.key, count=1)
+        return self._to_seq(last[0][0]) if last else 0
+
+    def append(self, events: List[Tuple[str, str, str]]) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        for space_id, event_type, data in events:
+            pipe.xadd(self.key, {"space_id": space_id, "event_type": event_type, "data": data},
+                      maxlen=self.max_length, approximate=True)
+        pipe.execute()
+
+    def read_after(self, seq: int, limit: int) -> List[Tuple[int, str, str, str]]:
+        result = self._redis.xread({self.key: self._to_stream_id(seq)}, count=limit)
+        rows = []
+        for _, entries in result:
+            for stream_id, fields in entries:
+                rows.append((self._to_seq(stream_id), fields[b"space_id"].decode(),
+                             fields[b"event_type"].decode(), fields[b"data"].decode()))
+        return rows
+
+    def prune(self) -> None:
+        # 件数の上限は追記時の MAXLEN で保つ
+        pass
+
+
+def create_event_log(name: str = EVENT_BACKEND):
+    """環境変数 TODOLIS_EVENT_BACKEND で指定された共有イベントログを生成する。memory の場合は None。"""
+    if name == "memory":
+        return None
+    if name == "sqlite":
+        return SQLiteEventLog()
+    if name == "redis":
+        return RedisEventLog()
+    raise ValueError(f"Unknown event backend: {name}")
+
+
+class Subscription:
+    """1つのクライアント接続に対応する購読。"""
+
+    def __init__(self, space_id: str, queue_size: int):
+        self.space_id = space_id
+        self.queue: "asyncio.Queue[Tuple[str, str, str]]" = asyncio.Queue(maxsize=queue_size)
+        # 送信が追いつかずキューが溢れた場合に True になる
+        self.overflowed = False
+
+
+class _SpaceHistory:
+    """1つのスペースの直近のイベント。complete_after より後の連番のイベントは全て events に残っている。"""
+
+    __slots__ = ("events", "complete_after")
+
+    def __init__(self, complete_after: int, size: int):
+        self.events: Deque[Tuple[int, Tuple[str, str, str]]] = deque(maxlen=size)
+        self.complete_after = complete_after
+
+
+class SpaceEventBroker:
+    """
+    スペース単位の変更イベントを購読者に配信する。
+    イベントIDは「ログのID:連番」で、連番は全スペースで共通に増える。直近のイベントは再接続時に再送できる。
+
+    - 共有ログ (log) がある場合、publish() したイベントはログに追記され、全ワーカーがログを読んで自分の購読者に配信する。
+      ログのIDと連番は全ワーカーで共通のため、再接続先のワーカーが変わっても続きから再開できる
+    - 共有ログがない場合 (memory) はワーカープロセス内でのみ配信する。他のワーカーの書き込みは届かないため、
+      同じマシンで複数のワーカーが動いている場合は available() が False を返し、購読を受け付けない
+    - 履歴を保持するスペース数は max_spaces までで、購読者のいないスペースから最後の更新が古い順に捨てる。
+      捨てた履歴の範囲からの再開は reset になる
+    """
+
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE, queue_size: int = EVENT_QUEUE_SIZE,
+                 max_spaces: int = EVENT_MAX_SPACES, log=None, lock_dir: str = EVENT_LOCK_DIR):
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self.max_spaces = max_spaces
+        self.log = log
+        self.lock_dir = lock_dir
+        self.log_id = uuid.uuid4().hex[:8]
+        # 配信済みの最後の連番と、捨てた履歴に含まれていた最後の連番
+        self._last_seq = 0
+        self._evicted_upto = 0
+        self._history: "OrderedDict[str, _SpaceHistory]" = OrderedDict()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._outbox: List[Tuple[str, str, str]] = []
+        self._outbox_ready: Optional[asyncio.Event] = None
+        self._poll_wakeup: Optional[asyncio.Event] = None
+        self._poll_lock: Optional[asyncio.Lock] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lock_file = None
+
+    @property
+    def shared(self) -> bool:
+        return self.log is not None
+
+    # --- 起動・終了 -------------------------------------------------------------
+    async def start(self) -> None:
+        if self.log is None:
+            await asyncio.to_thread(self._hold_worker_lock)
+            return
+        self.log_id = await asyncio.to_thread(self.log.log_id)
+        # 起動前のイベントは持っていないため、それ以前からの再開は reset にする
+        self._last_seq = self._evicted_upto = await asyncio.to_thread(self.log.tail)
+        self._outbox_ready = asyncio.Event()
+        self._poll_wakeup = asyncio.Event()
+        self._poll_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._write_forever()), asyncio.create_task(self._poll_forever())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._outbox:
+            try:
+                await asyncio.to_thread(self.log.append, self._outbox)
+                self._outbox = []
+            except Exception as e:
+                logger.warning(f"Dropped {len(self._outbox)} space events on shutdown: {e}")
+        if self._lock_file is not None:
+            await asyncio.to_thread(self._release_worker_lock)
+
+    def _hold_worker_lock(self) -> None:
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._lock_file = open(os.path.join(self.lock_dir, f"worker-{os.getpid()}.lock"), "w")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+
+    def _release_worker_lock(self) -> None:
+        path = self._lock_file.name
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _other_workers_running(self) -> bool:
+        own = self._lock_file.name if self._lock_file is not None else None
+        for path in glob.glob(os.path.join(self.lock_dir, "worker-*.lock")):
+            if path == own:
+                continue
+            with open(path, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return True
+                # 終了したワーカーの残りのファイル
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return False
+
+    async def available(self) -> bool:
+        """購読を受け付けられるか。memory で同じマシンに他のワーカーがいる場合は、書き込みを取りこぼすため False。"""
+        if self.log is not None:
+            return True
+        return not await asyncio.to_thread(self._other_workers_running)
+
+    # --- 配信 -----------------------------------------------------------------
+    def has_subscribers(self, space_id: Optional[str] = None) -> bool:
+        """購読者がいる可能性があるか。共有ログの場合は他のワーカーの購読者が分からないため常に True。"""
+        if self.log is not None:
+            return True
+        if space_id is None:
+            return bool(self._subscribers)
+        return bool(self._subscribers.get(space_id))
+
+    def publish(self, space_id: str, event_type: str, data: dict) -> None:
+        """イベントを履歴に追加し、スペースの全購読者に配信する（共有ログの場合はログに追記する）。"""
+        data = json.dumps(data, ensure_ascii=False, default=str)
+        if self.log is None:
+            self._deliver(self._last_seq + 1, space_id, event_type, data)
+            return
+        if self._outbox_ready is None:
+            return  # start() 前（lifespan の外）は共有ログに書かない
+        if len(self._outbox) >= EVENT_OUTBOX_SIZE:
+            logger.error(f"Space event outbox is full, dropping {event_type} for space {space_id}")
+            return
+        self._outbox.append((space_id, event_type, data))
+        self._outbox_ready.set()
+
+    def _deliver(self, seq: int, space_id: str, event_type: str, data: str) -> None:
+        self._last_seq = max(self._last_seq, seq)
+        event = (f"{self.log_id}:{seq}", event_type, data)
+        history = self._history.get(space_id)
+        if history is None:
+            # これより前のこのスペースのイベントは、捨てた履歴か起動前のものにしか含まれない
+            history = self._history[space_id] = _SpaceHistory(self._evicted_upto, self.history_size)
+        else:
+            self._history.move_to_end(space_id)
+        if len(history.events) == history.events.maxlen:
+            history.complete_after = history.events[0][0]
+        history.events.append((seq, event))
+        self._evict()
+
+        for subscription in self._subscribers.get(space_id, ()):
+            if subscription.overflowed:
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 遅い購読者のためにイベントを溜め込まない
+                subscription.overflowed = True
+
+    def _evict(self) -> None:
+        while len(self._history) > self.max_spaces:
+            victim = next((space_id for space_id in self._history if space_id not in self._subscribers), None)
+            if victim is None:
+                return  # 全てのスペースに購読者がいる
+            history = self._history.pop(victim)
+            if history.events:
+                self._evicted_upto = max(self._evicted_upto, history.events[-1][0])
+
+    async def poll(self) -> int:
+        """共有ログから未読のイベントを読み込んで配信する。読み込んだ件数を返す。"""
+        async with self._poll_lock:
+            rows = await asyncio.to_thread(self.log.read_after, self._last_seq, _POLL_BATCH)
+            for seq, space_id, event_type, data in rows:
+                self._deliver(seq, space_id, event_type, data)
+            return len(rows)
+
+    async def catch_up(self) -> None:
+        """共有ログの最新のイベントまで読み込む（別のワーカーで受け取ったイベントIDからの再開に備える）。"""
+        if self._poll_lock is None:
+            return
+        try:
+            await self.poll()
+        except Exception as e:
+            logger.warning(f"Failed to read space events: {e}")
+
+    async def _write_forever(self) -> None:
+        while True:
+            await self._outbox_ready.wait()
+            self._outbox_ready.clear()
+            batch, self._outbox = self._outbox, []
+            try:
+                await asyncio.to_thread(self.log.append, batch)
+            except Exception as e:
+                logger.warning(f"Failed to append {len(batch)} space events, retrying: {e}")
+                self._outbox[:0] = batch
+                await asyncio.sleep(EVENT_POLL_SECONDS)
+                self._outbox_ready.set()
+                continue
+            # 自分のイベントは次の読み込みを待たずに配信する
+            self._poll_wakeup.set()
+
+    async def _poll_forever(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            try:
+                if await self.poll() == _POLL_BATCH:
+                    continue
+                if time.monotonic() - last_prune > _PRUNE_INTERVAL_SECONDS:
+                    last_prune = time.monotonic()
+                    await asyncio.to_thread(self.log.prune)
+            except Exception as e:
+                logger.warning(f"Failed to read space events: {e}")
+            try:
+                await asyncio.wait_for(self._poll_wakeup.wait(), timeout=EVENT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._poll_wakeup.clear()
+
+    # --- 購読 -----------------------------------------------------------------
+    def subscribe(self, space_id: str, last_event_id: Optional[str] = None) -> Tuple[Subscription, List[Tuple[str, str, str]], bool]:
+        """
+        購読を開始する。last_event_id 以降のイベントが履歴に残っていればそれを返す。
+        履歴から再開できない場合は reset が必要であることを示す True を返す。
+        """
+        subscription = Subscription(space_id, self.queue_size)
+        self._subscribers.setdefault(space_id, set()).add(subscription)
+
+        if not last_event_id:
+            return subscription, [], False
+        log_id, _, seq = last_event_id.partition(":")
+        if log_id != self.log_id or not seq.isdigit():
+            return subscription, [], True
+
+        last_seq = int(seq)
+        history = self._history.get(space_id)
+        complete_after = history.complete_after if history is not None else self._evicted_upto
+        # 履歴が欠けている場合（古すぎる、またはまだ存在しない連番）は再開できない
+        if last_seq < complete_after or last_seq > self._last_seq:
+            return subscription, [], True
+        missed = [event for seq, event in (history.events if history is not None else ()) if seq > last_seq]
+        return subscription, missed, False
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.space_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.space_id]
+                self._evict()
+
+
+def format_event(event_id: Optional[str], event_type: str, data: str) -> str:
+    """Server-Sent Events の形式に整形する。"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_events(broker: SpaceEventBroker, space_id: str, last_event_id: Optional[str] = None,
+                        heartbeat: float = EVENT_HEARTBEAT_SECONDS):
+    """
+    購読者へ送るSSEの文字列を順に返す非同期ジェネレーター。
+    履歴から再開できない場合や、送信が追いつかなかった場合は reset を送って終了する（クライアントは再読み込みする）。
+    """
+    await broker.catch_up()
+    subscription, missed, needs_reset = broker.subscribe(space_id, last_event_id)
+    try:
+        if needs_reset:
+            yield format_event(None, "reset", json.dumps({"space_id": space_id}))
+        for event in missed:
+            yield format_event(*event)
+
+        while True:
+            if subscription.overflowed:
+                yield format_event(None, "reset", json.dumps({"space_id": space_id}))
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(*event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+# ワーカープロセス内で共有するブローカー
+space_events = SpaceEventBroker(log=create_event_log())
@@ -0,0 +1,98 @@
+import csv
+import io
+import logging
+import os
+from typing import AsyncIterator, Callable, List
+
+from pagination import apply_keyset, split_page
+from repository import execute, table
+from responses import dumps
+
+logger = logging.getLogger("uvicorn.error")
+
+# 1回の問い合わせで取得する目標の件数（PostgRESTの max-rows を超えないこと）
+EXPORT_PAGE_SIZE = int(os.getenv("TODOLIS_EXPORT_PAGE_SIZE", "500"))
+# コメント・リアクションを取得する際に in.(...) に並べる目標IDの数（URLの長さを抑えるため）
+EXPORT_GOAL_ID_BATCH = int(os.getenv("TODOLIS_EXPORT_GOAL_ID_BATCH", "100"))
+
+# goals.csv と同じカラム順
+GOAL_CSV_COLUMNS = ("id", "space_id", "title", "detail", "assignee", "status", "due_on", "tags",
+                    "order_index", "created_at", "updated_at")
+# エクスポートに含めるスペースのカラム（閲覧・編集トークンは含めない）
+SPACE_EXPORT_COLUMNS = "id,title,created_at,updated_at"
+
+
+async def iter_pages(make_query: Callable, page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[dict]]:
+    """make_query() で組み立てたクエリを (created_at, id) のキーセットでページングし、1ページずつ返す。"""
+    cursor = None
+    while True:
+        res = await execute(apply_keyset(make_query(), cursor, page_size))
+        rows, cursor = split_page(res.data or [], page_size)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+async def iter_goal_pages(space_id: str, columns: str = "*") -> AsyncIterator[List[dict]]:
+    async for goals in iter_pages(lambda: table("goals").select(columns).eq("space_id", space_id)):
+        yield goals
+
+
+async def iter_children(table_name: str, goal_ids: List[str]) -> AsyncIterator[List[dict]]:
+    """目標IDのリストに紐づくコメント・リアクションを、目標IDを分割しつつページングして返す。"""
+    for start in range(0, len(goal_ids), EXPORT_GOAL_ID_BATCH):
+        batch = goal_ids[start:start + EXPORT_GOAL_ID_BATCH]
+        async for rows in iter_pages(lambda: table(table_name).select("*").in_("goal_id", batch)):
+            yield rows
+
+
+def _ndjson(record_type: str, rows: List[dict]) -> bytes:
+    return b"".join(dumps({"type": record_type, "data": row}) + b"\n" for row in rows)
+
+
+async def export_ndjson(space: dict) -> AsyncIterator[bytes]:
+    """
+    スペース・目標・コメント・リアクションを1行1レコードのNDJSONで出力する。
+    各行は {"type": "space" | "goal" | "comment" | "reaction", "data": {...}} の形式で、
+    目標1ページごとに、その目標のコメントとリアクションが続く。
+    途中でエラーが発生した場合は {"type": "error", ...} の行を出力して終了する。
+    """
+    yield _ndjson("space", [space])
+    try:
+        async for goals in iter_goal_pages(space["id"]):
+            yield _ndjson("goal", goals)
+            goal_ids = [goal["id"] for goal in goals]
+            for table_name, record_type in (("comments", "comment"), ("reactions", "reaction")):
+                async for rows in iter_children(table_name, goal_ids):
+                    yield _ndjson(record_type, rows)
+    except Exception as e:
+        logger.exception(f"Export of space {space['id']} failed")
+        yield dumps({"type": "error", "data": {"message": f"An error occurred: {e}"}}) + b"\n"
+
+
+def _goal_csv_row(goal: dict) -> list:
+    row = [goal.get(column) for column in GOAL_CSV_COLUMNS]
+    tags = goal.get("tags")
+    row[GOAL_CSV_COLUMNS.index("tags")] = ",".join(tags) if isinstance(tags, list) else tags
+    return ["" if value is None else value for value in row]
+
+
+async def export_goals_csv(space: dict) -> AsyncIterator[bytes]:
+    """スペースの目標を goals.csv と同じカラム構成のCSVで出力する（tags はカンマ区切りの1セル）。"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(GOAL_CSV_COLUMNS)
+    try:
+        async for goals in iter_goal_pages(space["id"]):
+            writer.writerows(_goal_csv_row(goal) for goal in goals)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    except Exception:
+        # CSVにはエラー行を書けないため、接続を切って途中で終わったことをクライアントに伝える
+        logger.exception(f"CSV export of space {space['id']} failed")
+        raise
+    # ヘッダーのみ（目標が0件）の場合
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,312 @@
+"""
+goals.csv 形式のCSVから目標を一括で取り込む。
+
+APIの POST /api/spaces/{space_id}/goals/import から使われるほか、
+コマンドラインからファイルをAPIへストリーミングで送信できる。
+
+    python goal_import.py goals.csv --space-id <space_id> --token <edit_token> [--api-url http://localhost:8000]
+    python goal_import.py goals.csv --space-id <space_id> --token <edit_token> --import-id <import_id> --start-row 12001   # 途中から再開
+"""
+import argparse
+import codecs
+import csv
+import json
+import os
+import re
+import time
+import uuid
+from datetime import date, datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+from postgrest.types import ReturnMethod
+
+from repository import execute, table
+
+# 1回の一括書き込み（upsert）で送る行数
+IMPORT_BATCH_SIZE = int(os.getenv("TODOLIS_IMPORT_BATCH_SIZE", "1000"))
+# 既存の目標IDが他のスペースのものでないかを確認する際に in.(...) に並べるIDの数
+IMPORT_ID_CHECK_BATCH = int(os.getenv("TODOLIS_IMPORT_ID_CHECK_BATCH", "100"))
+# レスポンスに含める行エラーの最大件数
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("TODOLIS_IMPORT_MAX_REPORTED_ERRORS", "1000"))
+
+IMPORT_COLUMNS = ("id", "space_id", "title", "detail", "assignee", "status", "due_on", "tags",
+                  "order_index", "created_at", "updated_at")
+IMPORT_STATUSES = ("todo", "doing", "done", "close")
+# 取り込みIDと行番号から目標IDを決めるための名前空間（同じ取り込みIDで再実行すれば同じIDになる）
+IMPORT_ID_NAMESPACE = uuid.UUID("6f1c3f0e-8d0a-4b7e-9a57-0c1f3c7a2d41")
+# 取り込みIDとして受け付ける文字列
+IMPORT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_LINE_END = re.compile(r"\r\n|\r|\n")
+
+
+def _split_lines(text: str) -> Tuple[List[str], str]:
+    """
+    改行 (\r\n, \r, \n) で行に分け、改行で終わっていない末尾を別に返す。
+    open(newline="") でCSVを読む場合と同じく、U+2028 などの他の改行文字では分けない。
+    末尾の \r は次のチャンクの \n と合わせて1つの改行になりうるため、末尾側に残す。
+    """
+    lines = []
+    start = 0
+    for match in _LINE_END.finditer(text):
+        if match.group() == "\r" and match.end() == len(text):
+            break
+        lines.append(text[start:match.end()])
+        start = match.end()
+    return lines, text[start:]
+
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """
+    バイト列のチャンクを受け取った順にCSVのレコードへ分解する。
+    ダブルクォートの数が偶数になった改行をレコードの区切りとみなすため、
+    セル内の改行を含むレコードもファイル全体を読み込まずに扱える。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""     # 改行で終わっていない末尾
+    record = []      # 組み立て中のレコード（セル内改行を含む場合は複数行）
+    quotes = 0
+
+    async for chunk in chunks:
+        lines, pending = _split_lines(pending + decoder.decode(chunk))
+        for line in lines:
+            record.append(line)
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                yield next(csv.reader(record), [])
+                record = []
+                quotes = 0
+
+    lines, rest = _split_lines(pending + decoder.decode(b"", final=True))
+    record += lines + ([rest] if rest else [])
+    if "".join(record).strip():
+        yield next(csv.reader(record), [])
+
+
+def _parse_timestamp(value: str) -> str:
+    # "2024-01-01 09:00:00+09" のような時差が時のみの表記も受け付ける
+    if re.search(r"[+-]\d{2}$", value):
+        value += ":00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        raise ValueError("timezone is required")
+    return parsed.isoformat()
+
+
+def validate_row(values: dict, row_number: int, space_id: str, import_id: str,
+                 now: str) -> Tuple[Optional[dict], List[str]]:
+    """
+    CSVの1行を goals テーブルの行に変換する。エラーがあればエラーメッセージのリストを返す。
+    space_id 列は無視し、取り込み先のスペースを使う。id が空の場合はスペース・取り込みID・行番号から決まるIDを振る。
+    """
+    errors = []
+    goal_id = (values.get("id") or "").strip()
+    if goal_id:
+        try:
+            goal_id = str(uuid.UUID(goal_id))
+        except ValueError:
+            errors.append("id must be a UUID")
+    else:
+        goal_id = str(uuid.uuid5(IMPORT_ID_NAMESPACE, f"{space_id}:{import_id}:{row_number}"))
+
+    title = (values.get("title") or "").strip()
+    if not title:
+        errors.append("title is required")
+
+    status = (values.get("status") or "todo").strip()
+    if status not in IMPORT_STATUSES:
+        errors.append(f"Unknown status: {status}")
+
+    due_on = (values.get("due_on") or "").strip() or None
+    if due_on:
+        try:
+            due_on = date.fromisoformat(due_on).isoformat()
+        except ValueError:
+            errors.append("due_on must be YYYY-MM-DD")
+
+    order_index = (values.get("order_index") or "").strip()
+    try:
+        order_index = int(order_index) if order_index else 0
+    except ValueError:
+        errors.append("order_index must be an integer")
+
+    timestamps = {}
+    for column in ("created_at", "updated_at"):
+        value = (values.get(column) or "").strip()
+        try:
+            timestamps[column] = _parse_timestamp(value) if value else now
+        except ValueError:
+            errors.append(f"{column} must be an ISO 8601 timestamp with timezone")
+
+    if errors:
+        return None, errors
+    return {
+        "id": goal_id,
+        "space_id": space_id,
+        "title": title,
+        "detail": values.get("detail") or "",
+        "assignee": (values.get("assignee") or "").strip() or None,
+        "status": status,
+        "due_on": due_on,
+        "tags": [tag.strip() for tag in (values.get("tags") or "").split(",") if tag.strip()],
+        "order_index": order_index,
+        **timestamps,
+    }, []
+
+
+async def _foreign_ids(goal_ids: List[str], space_id: str) -> set:
+    """他のスペースにすでに存在する目標IDを返す（上書きしてしまわないように除外する）。"""
+    foreign = set()
+    for start in range(0, len(goal_ids), IMPORT_ID_CHECK_BATCH):
+        batch = goal_ids[start:start + IMPORT_ID_CHECK_BATCH]
+        res = await execute(table("goals").select("id,space_id").in_("id", batch))
+        foreign.update(row["id"] for row in res.data or [] if row["space_id"] != space_id)
+    return foreign
+
+
+async def _write_batch(rows: List[dict]) -> None:
+    # id が一致する行は上書きするため、同じファイルを再実行しても重複しない
+    await execute(table("goals").upsert(rows, on_conflict="id", returning=ReturnMethod.minimal))
+
+
+async def import_goals(chunks: AsyncIterator[bytes], space_id: str, start_row: int = 1,
+                       dry_run: bool = False, import_id: Optional[str] = None) -> dict:
+    """
+    CSVを読み込みながら IMPORT_BATCH_SIZE 行ずつ検証・一括書き込みを行い、結果のレポートを返す。
+    行番号はヘッダーを除いた1始まりで、start_row より前の行は読み飛ばす。
+    書き込みに失敗した場合はそこで中断し、resume_from_row に再開すべき行番号を返す。
+    id が空の行のIDは取り込みID (import_id) ごとに異なるため、別のファイルの取り込みで上書きされない。
+    import_id を省略すると新しく発行してレポートに含める。再開 (start_row > 1) には同じ import_id が必要。
+    ヘッダーに未知のカラムがある場合や title カラムがない場合、import_id が不正な場合は400を返す。
+    """
+    if import_id is None:
+        if start_row > 1:
+            raise HTTPException(status_code=400, detail="import_id is required to resume an import (start_row > 1)")
+        import_id = uuid.uuid4().hex
+    elif not IMPORT_ID_PATTERN.match(import_id):
+        raise HTTPException(status_code=400, detail="import_id must be 1-64 characters of A-Z, a-z, 0-9, _ or -")
+    started = time.perf_counter()
+    now = datetime.now().astimezone().isoformat()
+    report = {
+        "space_id": space_id,
+        "import_id": import_id,
+        "processed_rows": 0,
+        "imported_rows": 0,
+        "failed_rows": 0,
+        "errors": [],
+        "resume_from_row": None,
+        "dry_run": dry_run,
+    }
+
+    def add_error(row_number: int, messages: List[str]):
+        report["failed_rows"] += 1
+        if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "errors": messages})
+
+    batch: List[Tuple[int, dict, bool]] = []  # (行番号, 目標, CSVでidが指定されているか)
+    seen_ids = set()
+
+    async def flush() -> bool:
+        if not batch:
+            return True
+        rows = [goal for _, goal, _ in batch]
+        try:
+            # 行番号から振ったIDは取り込み先のスペース固有なので、CSVで指定されたIDだけを確認する
+            foreign = await _foreign_ids([goal["id"] for _, goal, explicit in batch if explicit], space_id)
+            if foreign:
+                for row_number, goal, _ in batch:
+                    if goal["id"] in foreign:
+                        add_error(row_number, ["id belongs to another space"])
+                rows = [goal for goal in rows if goal["id"] not in foreign]
+            if rows and not dry_run:
+                await _write_batch(rows)
+        except Exception as e:
+            report["resume_from_row"] = batch[0][0]
+            report["errors"].append({"row": batch[0][0], "errors": [f"Batch write failed: {e}"]})
+            return False
+        report["imported_rows"] += len(rows)
+        batch.clear()
+        seen_ids.clear()
+        return True
+
+    header = None
+    row_number = 0
+    async for record in iter_csv_records(chunks):
+        if header is None:
+            header = [column.strip() for column in record]
+            missing = [c for c in ("title",) if c not in header]
+            unknown = [c for c in header if c not in IMPORT_COLUMNS]
+            if missing or unknown:
+                raise HTTPException(status_code=400, detail="; ".join(
+                    [f"Missing column: {c}" for c in missing] + [f"Unknown column: {c}" for c in unknown]))
+            continue
+        if not any(cell.strip() for cell in record):
+            continue
+        row_number += 1
+        if row_number < start_row:
+            continue
+        report["processed_rows"] += 1
+
+        if len(record) != len(header):
+            add_error(row_number, [f"Expected {len(header)} columns, got {len(record)}"])
+            continue
+        goal_values = dict(zip(header, record))
+        goal, errors = validate_row(goal_values, row_number, space_id, import_id, now)
+        if errors:
+            add_error(row_number, errors)
+            continue
+        if goal["id"] in seen_ids:
+            # 同じ一括書き込みに同じIDが含まれるとupsertが失敗するため、重複は行エラーにする
+            add_error(row_number, ["Duplicate id in the same batch"])
+            continue
+        seen_ids.add(goal["id"])
+        batch.append((row_number, goal, bool((goal_values.get("id") or "").strip())))
+        if len(batch) >= IMPORT_BATCH_SIZE and not await flush():
+            break
+    else:
+        await flush()
+
+    elapsed = time.perf_counter() - started
+    report["elapsed_seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["processed_rows"] / elapsed, 1) if elapsed > 0 else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="取り込むCSVファイル（goals.csv 形式）")
+    parser.add_argument("--space-id", required=True)
+    parser.add_argument("--token", required=True, help="スペースの編集用トークン")
+    parser.add_argument("--api-url", default=os.getenv("TODOLIS_API_URL", "http://localhost:8000"))
+    parser.add_argument("--start-row", type=int, default=1, help="この行番号（ヘッダーを除き1始まり）から取り込む")
+    parser.add_argument("--import-id", help="取り込みID。再開する場合は前回のレポートの import_id を指定する（省略時は新しく発行）")
+    parser.add_argument("--dry-run", action="store_true", help="検証のみ行い、書き込まない")
+    args = parser.parse_args()
+    if args.import_id is None and args.start_row > 1:
+        parser.error("--start-row で再開する場合は前回の --import-id を指定してください")
+    import_id = args.import_id or uuid.uuid4().hex
+
+    def read_chunks():
+        with open(args.path, "rb") as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    return
+                yield chunk
+
+    res = httpx.post(
+        f"{args.api_url.rstrip('/')}/api/spaces/{args.space_id}/goals/import",
+        params={"token": args.token, "start_row": args.start_row, "dry_run": args.dry_run, "import_id": import_id},
+        content=read_chunks(),
+        headers={"Content-Type": "text/csv"},
+        timeout=None,
+    )
+    print(json.dumps(res.json(), ensure_ascii=False, indent=2))
+    if res.status_code >= 400 or res.json().get("resume_from_row"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
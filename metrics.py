@@ -0,0 +1,216 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger("uvicorn.error")
+
+# 1リクエストあたりのSupabase呼び出し回数がこの値を超えたら警告する
+UPSTREAM_CALLS_WARN_THRESHOLD = int(os.getenv("TODOLIS_UPSTREAM_CALLS_WARN", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+
+class Histogram:
+    """ラベルごとに累積バケット・合計・件数を持つPrometheus形式のヒストグラム。"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], list] = {}  # ラベル値 -> [バケットごとの件数..., 合計, 件数]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            label_text = _format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-1]}'
+            yield f"{self.name}_sum{{{label_text}}} {series[-2]}"
+            yield f"{self.name}_count{{{label_text}}} {series[-1]}"
+
+
+class Counter:
+    """ラベルごとの累積カウンター。"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{{{_format_labels(self.label_names, labels)}}} {value}"
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_DURATION = Histogram(
+    "todolis_request_duration_seconds", "Request latency including validation and serialization.",
+    ("method", "endpoint", "status"), LATENCY_BUCKETS)
+REQUEST_UPSTREAM_DURATION = Histogram(
+    "todolis_request_upstream_seconds", "Time spent waiting on Supabase per request.",
+    ("method", "endpoint"), LATENCY_BUCKETS)
+REQUEST_UPSTREAM_CALLS = Histogram(
+    "todolis_request_upstream_calls", "Number of Supabase calls per request.",
+    ("method", "endpoint"), CALL_COUNT_BUCKETS)
+REQUESTS_FLAGGED = Counter(
+    "todolis_requests_flagged_total", "Requests that exceeded the upstream call threshold.",
+    ("method", "endpoint"))
+UPSTREAM_DURATION = Histogram(
+    "todolis_upstream_duration_seconds", "Latency of each Supabase call.",
+    ("table", "operation", "outcome"), LATENCY_BUCKETS)
+SINGLEFLIGHT_REQUESTS = Counter(
+    "todolis_singleflight_requests_total", "Coalesced reads by role (leader ran the query, shared reused it).",
+    ("name", "role"))
+SINGLEFLIGHT_UPSTREAM_SAVED = Counter(
+    "todolis_singleflight_upstream_calls_saved_total", "Supabase calls avoided by sharing an in-flight read.",
+    ("name",))
+
+REGISTRY = (REQUEST_DURATION, REQUEST_UPSTREAM_DURATION, REQUEST_UPSTREAM_CALLS, REQUESTS_FLAGGED, UPSTREAM_DURATION,
+            SINGLEFLIGHT_REQUESTS, SINGLEFLIGHT_UPSTREAM_SAVED)
+
+
+class RequestStats:
+    """1リクエスト中のSupabase呼び出し回数と待ち時間。"""
+
+    __slots__ = ("calls", "upstream_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.upstream_seconds = 0.0
+
+
+_current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("todolis_request_stats", default=None)
+
+def set_request_stats(stats: RequestStats) -> None:
+    """以降のSupabase呼び出しを stats に集計する（タスク内で呼び出すと、そのタスクのみに適用される）。"""
+    _current_request.set(stats)
+
+
+def add_request_stats(stats: RequestStats) -> None:
+    """別に集計した呼び出し回数・待ち時間を、実行中のリクエストの集計に加える。"""
+    current = _current_request.get()
+    if current is not None:
+        current.calls += stats.calls
+        current.upstream_seconds += stats.upstream_seconds
+
+
+_OPERATIONS = {"GET": "select", "HEAD": "select", "POST": "insert", "PATCH": "update", "PUT": "upsert", "DELETE": "delete"}
+
+
+def describe_query(query) -> Tuple[str, str]:
+    """クエリビルダーから (テーブル名, 操作名) を取り出す。ストアドファンクションは ("rpc/<名前>", "rpc")。"""
+    request = getattr(query, "request", None)
+    if request is None:
+        return "unknown", "unknown"
+    segments = str(request.path).rstrip("/").split("/")
+    method = str(getattr(request.http_method, "value", request.http_method)).upper()
+    if len(segments) >= 2 and segments[-2] == "rpc":
+        return f"rpc/{segments[-1]}", "rpc"
+    return segments[-1], _OPERATIONS.get(method, method.lower())
+
+
+def record_upstream(table_name: str, operation: str, seconds: float, ok: bool) -> None:
+    """Supabase呼び出し1回分の所要時間を記録し、実行中のリクエストの集計に加える。"""
+    UPSTREAM_DURATION.observe(seconds, table_name, operation, "ok" if ok else "error")
+    stats = _current_request.get()
+    if stats is not None:
+        stats.calls += 1
+        stats.upstream_seconds += seconds
+
+
+class MetricsMiddleware:
+    """
+    エンドポイントごとのレイテンシ、Supabase呼び出し回数・待ち時間を記録するASGIミドルウェア。
+    呼び出し回数が閾値を超えたリクエストは警告ログとカウンターで記録する。
+    """
+
+    def __init__(self, app, calls_warn_threshold: int = UPSTREAM_CALLS_WARN_THRESHOLD):
+        self.app = app
+        self.calls_warn_threshold = calls_warn_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-upstream-calls", str(stats.calls).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_request.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            REQUEST_DURATION.observe(time.perf_counter() - started, method, endpoint, str(status_code))
+            REQUEST_UPSTREAM_DURATION.observe(stats.upstream_seconds, method, endpoint)
+            REQUEST_UPSTREAM_CALLS.observe(stats.calls, method, endpoint)
+            if stats.calls > self.calls_warn_threshold:
+                REQUESTS_FLAGGED.inc(method, endpoint)
+                logger.warning(f"{method} {scope.get('path')} made {stats.calls} upstream calls "
+                               f"(threshold {self.calls_warn_threshold})")
+
+
+def render(extra_gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    """登録済みのメトリクスをPrometheusのテキスト形式で返す。extra_gauges は {名前: {ラベル値: 値}}。"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, values in (extra_gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in values.items():
+            lines.append(f'{name}{{key="{_escape(key)}"}} {value}')
+    return "\n".join(lines) + "\n"
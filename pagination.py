@@ -0,0 +1,82 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+# 1ページあたりの最大件数
+MAX_PAGE_LIMIT = 500
+
+
+def encode_cursor(row: dict) -> str:
+    """ページ末尾の行の (created_at, id) から次ページ取得用のカーソル文字列を作る。"""
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    カーソル文字列を (created_at, id) に戻す。不正な場合は400を返す。
+    値はPostgRESTのフィルター文字列に埋め込むため、日時として読めない created_at やUUIDでない id は受け付けない。
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        datetime.fromisoformat(created_at)
+        return created_at, str(uuid.UUID(row_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def select_fields(fields: Optional[str], allowed: Sequence[str], default: Sequence[str],
+                  required: Sequence[str] = ()) -> Tuple[str, List[str]]:
+    """
+    fields= で指定されたカンマ区切りのカラム名を検証し、selectに渡す文字列を返す。
+    ページングなどで内部的に必要なカラム (required) は追加で取得し、
+    レスポンスから取り除くべきカラム名のリストとあわせて返す。
+    """
+    if fields:
+        columns = [c.strip() for c in fields.split(",") if c.strip()]
+        unknown = [c for c in columns if c not in allowed]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {', '.join(unknown)}")
+    else:
+        columns = list(default)
+
+    extra = [c for c in required if c not in columns]
+    return ",".join(columns + extra), extra
+
+
+def apply_keyset(query, cursor: Optional[str], limit: int):
+    """
+    (created_at, id) の昇順によるキーセットページングをクエリビルダーに適用する。
+    次ページの有無を判定するため limit + 1 件を取得する。
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.gt."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.gt."{row_id}")'
+        )
+    return (query
+            .order("created_at", desc=False)
+            .order("id", desc=False)
+            .limit(limit + 1))
+
+
+def split_page(rows: List[dict], limit: int) -> Tuple[List[dict], Optional[str]]:
+    """limit + 1 件の取得結果をページと次ページのカーソルに分ける。"""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(page[-1])
+
+
+def strip_fields(rows: List[dict], extra: Sequence[str]) -> None:
+    """内部的に取得しただけのカラムを各行から取り除く。"""
+    if extra:
+        for row in rows:
+            for column in extra:
+                row.pop(column, None)
@@ -0,0 +1,85 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# 1回のプロファイルで許可する最大秒数
+PROFILE_MAX_SECONDS = float(os.getenv("TODOLIS_PROFILE_MAX_SECONDS", "60"))
+# シグナルで起動した場合のプロファイル秒数と出力先
+PROFILE_SIGNAL_SECONDS = float(os.getenv("TODOLIS_PROFILE_SIGNAL_SECONDS", "10"))
+PROFILE_OUTPUT_DIR = os.getenv("TODOLIS_PROFILE_DIR", "/tmp")
+
+# 同時に実行できるプロファイルは1つだけ
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """別のプロファイルが実行中の場合に送出される。"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """
+    指定秒数の間、interval秒ごとにプロセス内の全スレッドのスタックを採取し、
+    flamegraph.pl / speedscope などで読めるcollapsed-stack形式（1行に「関数;関数;... 回数」）で返す。
+    採取は呼び出したスレッドで行うため、実行していない間のオーバーヘッドはない。
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("another profile is already running")
+    try:
+        seconds = min(max(seconds, 0.0), PROFILE_MAX_SECONDS)
+        own_thread_id = threading.get_ident()
+        thread_names = {}
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(thread_names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    finally:
+        _profile_lock.release()
+
+
+def _profile_to_file(seconds: float) -> None:
+    try:
+        collapsed = sample_stacks(seconds)
+    except ProfilerBusy:
+        return
+    path = os.path.join(PROFILE_OUTPUT_DIR, f"todolis-profile-{os.getpid()}-{int(time.time())}.collapsed")
+    with open(path, "w") as f:
+        f.write(collapsed)
+
+
+def install_signal_handler(signal_name: Optional[str]) -> bool:
+    """
+    指定されたシグナル（例: "SIGUSR2"）を受け取ると、PROFILE_SIGNAL_SECONDS 秒のプロファイルを
+    バックグラウンドで採取し PROFILE_OUTPUT_DIR に書き出すハンドラーを登録する。
+    """
+    if not signal_name:
+        return False
+    signum = getattr(signal, signal_name)
+
+    def handler(signum, frame):
+        threading.Thread(target=_profile_to_file, args=(PROFILE_SIGNAL_SECONDS,),
+                         name="todolis-profiler", daemon=True).start()
+
+    signal.signal(signum, handler)
+    return True
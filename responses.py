@@ -0,0 +1,29 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+# orjson がインストールされていれば使い、なければ標準ライブラリの json にフォールバックする
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson は任意の依存
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """JSONとしてエンコードしたバイト列を返す。"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    orjson（未インストール時は標準の json）でエンコードするJSONレスポンス。
+    エンドポイントからこのレスポンスを直接返すと、FastAPIの jsonable_encoder による
+    変換とレスポンスモデルの再検証を経由せずにそのままシリアライズされる。
+    Supabaseから取得した行は JSON の基本型だけで構成されているため、そのまま渡してよい。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import metrics
+
+
+class _Flight:
+    """実行中の問い合わせと、その中で行われたSupabase呼び出しの集計。"""
+
+    __slots__ = ("task", "stats")
+
+    def __init__(self, task: asyncio.Task, stats: metrics.RequestStats):
+        self.task = task
+        self.stats = stats
+
+
+class SingleFlight:
+    """
+    同じキーの読み取りが同時に届いた場合に、Supabaseへの問い合わせを1回にまとめる。
+    最初のリクエスト（リーダー）が問い合わせを実行し、実行中に届いた同じキーのリクエストはその結果（または例外）を共有する。
+    問い合わせは別タスクで実行するため、リーダーのクライアントが切断しても待っている他のリクエストには影響しない。
+    キーには書き込みで変わるバージョン (etag.current_version) を含め、書き込み前に始まった問い合わせの結果を
+    書き込み後のリクエストに返さないようにする。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """key の問い合わせが実行中ならその結果を待ち、そうでなければ fn() を実行して結果を返す。"""
+        flight = self._flights.get(key)
+        if flight is not None:
+            metrics.SINGLEFLIGHT_REQUESTS.inc(self.name, "shared")
+            try:
+                return await asyncio.shield(flight.task)
+            finally:
+                metrics.SINGLEFLIGHT_UPSTREAM_SAVED.inc(self.name, amount=flight.stats.calls)
+
+        metrics.SINGLEFLIGHT_REQUESTS.inc(self.name, "leader")
+        stats = metrics.RequestStats()
+        flight = _Flight(asyncio.ensure_future(self._run(fn, stats)), stats)
+        self._flights[key] = flight
+        flight.task.add_done_callback(lambda _: self._done(key, flight))
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            # まとめた問い合わせの回数・待ち時間はリーダーのリクエストに計上する
+            metrics.add_request_stats(stats)
+
+    def _done(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    @staticmethod
+    async def _run(fn: Callable[[], Awaitable[Any]], stats: metrics.RequestStats) -> Any:
+        # タスクはコンテキストのコピーで動くため、ここでの設定はリーダーのリクエストの集計に影響しない
+        metrics.set_request_stats(stats)
+        return await fn()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,471 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+from analytics import EPOCH_ORDINAL, NO_DUE, STATUS_CODES, TODO, GoalColumns, np
+from export import iter_goal_pages
+
+logger = logging.getLogger("uvicorn.error")
+
+# 分析用スナップショットを使うかどうか（"1"で有効。numpy が必要）
+SNAPSHOT_ENABLED = os.getenv("TODOLIS_SNAPSHOT", "0") == "1" and np is not None
+# スナップショットの保存先（同じマシン上のワーカー間で共有される）
+SNAPSHOT_DIR = os.getenv("TODOLIS_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "todolis-snapshot"))
+# この秒数より前に作り直したスナップショットは、Supabaseから読み直して作り直す（コンパクション）
+SNAPSHOT_COMPACT_SECONDS = float(os.getenv("TODOLIS_SNAPSHOT_COMPACT_SECONDS", "3600"))
+# 新規作成・作り直し時に確保する最小の行数
+SNAPSHOT_MIN_CAPACITY = int(os.getenv("TODOLIS_SNAPSHOT_MIN_CAPACITY", "1024"))
+# この秒数読み取られていないスナップショットは削除する
+SNAPSHOT_TTL_SECONDS = float(os.getenv("TODOLIS_SNAPSHOT_TTL_SECONDS", "86400"))
+# 作り直しを始めたワーカーがこの秒数以内に終えない場合は、他のワーカーが作り直してよい
+SNAPSHOT_REBUILD_LEASE_SECONDS = float(os.getenv("TODOLIS_SNAPSHOT_REBUILD_LEASE_SECONDS", "600"))
+# 読み取り日時（TTLの判定に使う）をファイルに記録する間隔（秒）
+SNAPSHOT_TOUCH_SECONDS = 60
+
+SNAPSHOT_COLUMNS = "id,status,assignee,due_on,created_at"
+# 列名 -> dtype。id はUUIDの文字列をそのまま固定長バイト列で持つ
+COLUMN_DTYPES = {"id": "S36", "assignee": "int32", "status": "int8", "due_on": "int32"}
+
+
+class SnapshotStore:
+    """
+    スペースごとの目標を、列ごとのメモリマップされた .npy ファイルとして保持する。
+
+    <dir>/<space_id>/meta.json       : 世代番号・行数・担当者の辞書・作成時刻・書き込み回数
+    <dir>/<space_id>/<列名>.<世代>.npy : 行数に余裕を持たせて確保した列（先頭 length 行が有効）
+    <dir>/<space_id>/read            : 最終更新日時が最後に読み取られた日時（SNAPSHOT_TOUCH_SECONDS 単位）
+
+    目標の作成・更新・クローズは upsert() で該当行をその場で書き換えるか末尾に追記する。
+    確保した行数を超えたときだけ、2倍の大きさの新しい世代にコピーする。
+    読み取り (columns) はメモリマップの先頭 length 行をそのまま返すため、データのコピーは発生しない。
+    一括操作・取り込みなど行の内容が分からない変更では mark_stale() で無効にし、次の読み取り時に作り直す。
+    書き込みはスペースごとのファイルロック (fcntl.flock) で、同じマシン上の全ワーカー間で直列化する。
+
+    作り直しはロックの外でSupabaseから行を読み込むため、begin_rebuild() で書き込み回数を控えてから読み込み、
+    rebuild() で書き込み回数が変わっていない場合だけ新しい世代を公開する。
+    スナップショットは既にあるスペースにだけ反映し、目標のないスペースや TTL の間読み取られていないスペースの
+    ディレクトリは削除する。
+    """
+
+    def __init__(self, directory: str = SNAPSHOT_DIR, min_capacity: int = SNAPSHOT_MIN_CAPACITY):
+        self.directory = directory
+        self.min_capacity = min_capacity
+        self._maps: Dict[tuple, dict] = {}  # (space_id, 世代, モード) -> {列名: np.memmap}
+        self._maps_lock = threading.Lock()
+        # space_id -> (世代, 索引済みの行数, {目標ID: 行番号})。行は世代内で追記されるだけなので差分で索引を伸ばせる
+        self._row_indexes: Dict[str, tuple] = {}
+        # space_id -> 読み取り日時を最後に記録した時刻 (time.monotonic)
+        self._touched: Dict[str, float] = {}
+
+    # --- ファイル操作 ---------------------------------------------------------
+    def _space_dir(self, space_id: str) -> str:
+        # パス区切りなどを含むIDでディレクトリの外（または保存先そのもの）を指さないようにする
+        name = space_id.replace("/", "_").replace("..", "_")
+        if name in ("", "."):
+            raise ValueError(f"Invalid space id: {space_id!r}")
+        return os.path.join(self.directory, name)
+
+    def _space_ids(self) -> List[str]:
+        """スナップショットのあるスペースのID（保存先のサブディレクトリ名）を返す。"""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        return [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+
+    def _column_path(self, space_id: str, column: str, generation: int) -> str:
+        return os.path.join(self._space_dir(space_id), f"{column}.{generation}.npy")
+
+    @contextmanager
+    def _locked(self, space_id: str, create: bool = False):
+        """
+        スペースのロックを取る。ディレクトリがなければ create=True の場合は作り、そうでなければ False を返す。
+        ロックを待つ間にディレクトリが削除された (evict_unread) 場合は開き直す。
+        """
+        directory = self._space_dir(space_id)
+        path = os.path.join(directory, "lock")
+        while True:
+            if create:
+                os.makedirs(directory, exist_ok=True)
+            try:
+                lock_file = open(path, "a")
+            except FileNotFoundError:
+                if create:
+                    continue
+                yield False
+                return
+            with lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    current = os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    try:
+                        yield True
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    return
+
+    def _read_meta(self, space_id: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._space_dir(space_id), "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, space_id: str, meta: dict) -> None:
+        # 一時ファイルに書いてから置き換え、読み手が書きかけのメタデータを読まないようにする
+        path = os.path.join(self._space_dir(space_id), "meta.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _open(self, space_id: str, generation: int, mode: str) -> dict:
+        key = (space_id, generation, mode)
+        with self._maps_lock:
+            arrays = self._maps.get(key)
+            if arrays is None:
+                # 古い世代のメモリマップは手放す
+                for stale in [k for k in self._maps if k[0] == space_id and k[1] != generation]:
+                    del self._maps[stale]
+                arrays = {column: np.load(self._column_path(space_id, column, generation), mmap_mode=mode)
+                          for column in COLUMN_DTYPES}
+                self._maps[key] = arrays
+            return arrays
+
+    def _create_generation(self, space_id: str, generation: int, capacity: int) -> dict:
+        return {
+            column: np.lib.format.open_memmap(self._column_path(space_id, column, generation), mode="w+",
+                                              dtype=dtype, shape=(capacity,))
+            for column, dtype in COLUMN_DTYPES.items()
+        }
+
+    def _remove_generations(self, space_id: str, keep: int) -> None:
+        for name in os.listdir(self._space_dir(space_id)):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[2] == "npy" and parts[1] != str(keep):
+                try:
+                    os.remove(os.path.join(self._space_dir(space_id), name))
+                except FileNotFoundError:
+                    pass
+
+    def _row_index(self, space_id: str, generation: int, ids, length: int) -> Dict[bytes, int]:
+        """目標ID -> 行番号の索引を返す。他のワーカーが追記した行があれば、その分だけ索引に加える。"""
+        cached = self._row_indexes.get(space_id)
+        if cached is None or cached[0] != generation or cached[1] > length:
+            cached = (generation, 0, {})
+        _, indexed, index = cached
+        if indexed < length:
+            index.update(zip(ids[indexed:length].tolist(), range(indexed, length)))
+        self._row_indexes[space_id] = (generation, length, index)
+        return index
+
+    # --- 行の変換 -------------------------------------------------------------
+    @staticmethod
+    def _encode(row: dict, assignee_codes: Dict[str, int], assignees: List[str]) -> tuple:
+        name = row.get("assignee") or ""
+        code = assignee_codes.get(name)
+        if code is None:
+            code = assignee_codes[name] = len(assignees)
+            assignees.append(name)
+        due_on = row.get("due_on")
+        due_days = NO_DUE
+        if due_on:
+            due_days = date.fromisoformat(due_on[:10]).toordinal() - EPOCH_ORDINAL
+        return code, STATUS_CODES.get(row.get("status"), TODO), due_days
+
+    def _drop(self, space_id: str) -> None:
+        """スペースのディレクトリを削除する（ロックを取った状態で呼ぶ）。"""
+        shutil.rmtree(self._space_dir(space_id), ignore_errors=True)
+        with self._maps_lock:
+            for key in [k for k in self._maps if k[0] == space_id]:
+                del self._maps[key]
+        self._row_indexes.pop(space_id, None)
+        self._touched.pop(space_id, None)
+
+    def _touch(self, space_id: str) -> None:
+        now = time.monotonic()
+        if now - self._touched.get(space_id, -SNAPSHOT_TOUCH_SECONDS) < SNAPSHOT_TOUCH_SECONDS:
+            return
+        self._touched[space_id] = now
+        try:
+            with open(os.path.join(self._space_dir(space_id), "read"), "a"):
+                pass
+            os.utime(os.path.join(self._space_dir(space_id), "read"))
+        except FileNotFoundError:
+            pass  # 別のワーカーが削除した直後
+
+    def _last_read(self, space_id: str) -> float:
+        for name in ("read", "meta.json"):
+            try:
+                return os.path.getmtime(os.path.join(self._space_dir(space_id), name))
+            except FileNotFoundError:
+                continue
+        return 0.0
+
+    # --- 公開API --------------------------------------------------------------
+    def begin_rebuild(self, space_id: str, max_age: Optional[float] = None) -> Optional[int]:
+        """
+        作り直しの開始を記録し、その時点の書き込み回数を返す（rebuild() に渡す）。
+        別のワーカーが作り直し中の場合は None を返す。
+        max_age を指定した場合（コンパクション）は、スナップショットが既にあり、無効か max_age 秒以上前に
+        作り直したものである場合だけ開始する。
+        """
+        with self._locked(space_id, create=max_age is None) as locked:
+            if not locked:
+                return None
+            now = time.time()
+            meta = self._read_meta(space_id)
+            if meta is None:
+                if max_age is not None:
+                    return None
+                # 世代番号は削除・再作成をまたいで重ならないように時刻から始める
+                # （他のワーカーが開いている削除前の世代のメモリマップを取り違えないため）
+                meta = {"generation": int(now * 1000), "length": 0, "capacity": 0, "assignees": [],
+                        "compacted_at": 0, "stale": True, "writes": 0}
+            elif now - meta.get("rebuilding_at", 0) < SNAPSHOT_REBUILD_LEASE_SECONDS:
+                return None
+            elif max_age is not None and not meta["stale"] and now - meta["compacted_at"] < max_age:
+                return None  # 別のワーカーが作り直した直後
+            meta["rebuilding_at"] = now
+            self._write_meta(space_id, meta)
+            return meta.get("writes", 0)
+
+    def rebuild(self, space_id: str, rows: Sequence[dict], writes: int) -> bool:
+        """
+        Supabaseから読み込んだ全行でスナップショットを作り直す（初回作成・コンパクション）。
+        writes は読み込む前に begin_rebuild() が返した書き込み回数。その後に書き込みがあった場合は
+        読み込んだ行に含まれていない可能性があるため公開せず、今のスナップショット（無効ならそのまま）を残して
+        False を返す。
+        目標がない場合はディレクトリを削除する。
+        """
+        assignees: List[str] = []
+        assignee_codes: Dict[str, int] = {}
+        encoded = [self._encode(row, assignee_codes, assignees) for row in rows]
+        capacity = max(self.min_capacity, int(len(rows) * 1.25))
+        with self._locked(space_id) as locked:
+            if not locked:
+                return False
+            meta = self._read_meta(space_id)
+            if meta is None:
+                return False
+            if meta.get("writes", 0) != writes:
+                meta.pop("rebuilding_at", None)
+                self._write_meta(space_id, meta)
+                return False
+            if not rows:
+                self._drop(space_id)
+                return False
+            generation = meta["generation"] + 1
+            arrays = self._create_generation(space_id, generation, capacity)
+            n = len(rows)
+            arrays["id"][:n] = [row["id"].encode() for row in rows]
+            codes = np.array(encoded, dtype=np.int64).reshape(n, 3)
+            arrays["assignee"][:n] = codes[:, 0]
+            arrays["status"][:n] = codes[:, 1]
+            arrays["due_on"][:n] = codes[:, 2]
+            for array in arrays.values():
+                array.flush()
+            self._write_meta(space_id, {
+                "generation": generation, "length": n, "capacity": capacity,
+                "assignees": assignees, "compacted_at": time.time(), "stale": False, "writes": writes,
+            })
+            self._remove_generations(space_id, keep=generation)
+            return True
+
+    def abort_rebuild(self, space_id: str) -> None:
+        """作り直しに失敗した場合に、begin_rebuild() で取った作り直しの権利を手放す。"""
+        with self._locked(space_id) as locked:
+            if not locked:
+                return
+            meta = self._read_meta(space_id)
+            if meta is not None and meta.pop("rebuilding_at", None) is not None:
+                self._write_meta(space_id, meta)
+
+    def upsert(self, space_id: str, rows: Sequence[dict]) -> None:
+        """目標の行を反映する。スナップショットがまだない（または無効な）スペースでは書き込み回数だけを数える。"""
+        with self._locked(space_id) as locked:
+            if not locked:
+                return
+            meta = self._read_meta(space_id)
+            if meta is None:
+                return
+            meta["writes"] = meta.get("writes", 0) + 1
+            if meta["stale"]:
+                self._write_meta(space_id, meta)
+                return
+            assignees = meta["assignees"]
+            assignee_codes = {name: code for code, name in enumerate(assignees)}
+            generation = meta["generation"]
+            arrays = self._open(space_id, generation, "r+")
+            length = meta["length"]
+            row_index = self._row_index(space_id, generation, arrays["id"], length)
+            for row in rows:
+                values = self._encode(row, assignee_codes, assignees)
+                goal_id = row["id"].encode()
+                index = row_index.get(goal_id)
+                if index is None:
+                    if length == meta["capacity"]:
+                        # 新しい世代でも行の位置は変わらないため、索引はそのまま使える
+                        arrays = self._grow(space_id, meta, arrays, length)
+                    index = row_index[goal_id] = length
+                    length += 1
+                    arrays["id"][index] = goal_id
+                arrays["assignee"][index], arrays["status"][index], arrays["due_on"][index] = values
+            # メモリマップへの書き込みは同じページキャッシュを通して他のワーカーからもすぐに見える。
+            # スナップショットはいつでも作り直せるため、ここでは flush (msync) しない
+            meta["length"] = length
+            self._write_meta(space_id, meta)
+            self._row_indexes[space_id] = (meta["generation"], length, row_index)
+            if meta["generation"] != generation:
+                # メタデータを書き換えてから古い世代を消す
+                self._remove_generations(space_id, keep=meta["generation"])
+
+    def _grow(self, space_id: str, meta: dict, arrays: dict, length: int) -> dict:
+        """確保した行数を使い切ったので、2倍の大きさの次の世代にコピーする。"""
+        generation = meta["generation"] + 1
+        capacity = meta["capacity"] * 2
+        grown = self._create_generation(space_id, generation, capacity)
+        for column, array in arrays.items():
+            grown[column][:length] = array[:length]
+        meta.update(generation=generation, capacity=capacity)
+        return grown
+
+    def mark_stale(self, space_id: str) -> None:
+        """スナップショットを無効にし、次の読み取り時に作り直させる。"""
+        with self._locked(space_id) as locked:
+            if not locked:
+                return
+            meta = self._read_meta(space_id)
+            if meta is not None:
+                meta["writes"] = meta.get("writes", 0) + 1
+                meta["stale"] = True
+                self._write_meta(space_id, meta)
+
+    def columns(self, space_id: str) -> Optional[GoalColumns]:
+        """スナップショットを列形式で返す（メモリマップをそのまま参照する）。ない・無効な場合は None。"""
+        meta = self._read_meta(space_id)
+        if meta is None or meta["stale"]:
+            return None
+        try:
+            arrays = self._open(space_id, meta["generation"], "r")
+        except FileNotFoundError:
+            # 別のワーカーが世代を切り替えた（または削除した）直後
+            return None
+        self._touch(space_id)
+        n = meta["length"]
+        return GoalColumns([space_id], np.zeros(n, dtype=np.int32), meta["assignees"],
+                           arrays["assignee"][:n], arrays["status"][:n], arrays["due_on"][:n])
+
+    def spaces_to_compact(self, max_age: float) -> List[str]:
+        """最後に作り直してから max_age 秒以上経ったスペースのIDを返す。"""
+        now = time.time()
+        space_ids = []
+        for space_id in self._space_ids():
+            try:
+                meta = self._read_meta(space_id)
+            except OSError as e:
+                logger.warning(f"Skipping analytics snapshot {space_id}: {e}")
+                continue
+            if meta is not None and (meta["stale"] or now - meta["compacted_at"] >= max_age):
+                space_ids.append(space_id)
+        return space_ids
+
+    def evict_unread(self, ttl: float) -> int:
+        """ttl 秒以上読み取られていないスペースのディレクトリを削除し、削除した数を返す。"""
+        evicted = 0
+        for space_id in self._space_ids():
+            try:
+                if time.time() - self._last_read(space_id) < ttl:
+                    continue
+                with self._locked(space_id) as locked:
+                    # ロックを待つ間に読み取られた場合は残す
+                    if locked and time.time() - self._last_read(space_id) >= ttl:
+                        self._drop(space_id)
+                        evicted += 1
+            except OSError as e:
+                logger.warning(f"Failed to evict analytics snapshot {space_id}: {e}")
+        return evicted
+
+    def clear(self) -> None:
+        with self._maps_lock:
+            self._maps.clear()
+        self._row_indexes.clear()
+        self._touched.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+store = SnapshotStore()
+
+
+async def _load_rows(space_id: str) -> List[dict]:
+    rows = []
+    async for goals in iter_goal_pages(space_id, SNAPSHOT_COLUMNS):
+        rows.extend(goals)
+    return rows
+
+
+async def load_space_columns(space_id: str) -> GoalColumns:
+    """
+    スナップショットから列形式の目標を返す。まだない・無効な場合はSupabaseから読み込んで作る。
+    作り直している間に書き込みがあった場合や、別のワーカーが作り直し中の場合は、読み込んだ行から集計する。
+    """
+    columns = await asyncio.to_thread(store.columns, space_id)
+    if columns is not None:
+        return columns
+    writes = await asyncio.to_thread(store.begin_rebuild, space_id)
+    if writes is None:
+        rows = await _load_rows(space_id)
+    else:
+        rows = await _rebuild(space_id, writes)
+        columns = await asyncio.to_thread(store.columns, space_id)
+    return columns or await asyncio.to_thread(GoalColumns.from_rows, space_id, rows)
+
+
+async def _rebuild(space_id: str, writes: int) -> List[dict]:
+    """begin_rebuild() の後にSupabaseから読み込んで作り直し、読み込んだ行を返す。失敗した場合は作り直しの権利を手放す。"""
+    done = False
+    try:
+        rows = await _load_rows(space_id)
+        await asyncio.to_thread(store.rebuild, space_id, rows, writes)
+        done = True
+        return rows
+    finally:
+        if not done:
+            await asyncio.to_thread(store.abort_rebuild, space_id)
+
+
+async def compact_forever(interval: float = SNAPSHOT_COMPACT_SECONDS, ttl: float = SNAPSHOT_TTL_SECONDS) -> None:
+    """
+    定期的に古いスナップショットをSupabaseから読み直して作り直し、読み取られていないものを削除する。
+    他のマシンのワーカーによる書き込みなど、upsert() で反映できなかった変更もここで取り込まれる。
+    各ワーカーで動くが、スペースごとに最初に begin_rebuild() したワーカーだけが作り直す。
+    """
+    while True:
+        await asyncio.sleep(min(interval, 60))
+        try:
+            evicted = await asyncio.to_thread(store.evict_unread, ttl)
+            if evicted:
+                logger.info(f"Evicted {evicted} unread analytics snapshots")
+            space_ids = await asyncio.to_thread(store.spaces_to_compact, interval)
+        except Exception as e:
+            logger.warning(f"Snapshot maintenance failed: {e}")
+            continue
+        for space_id in space_ids:
+            try:
+                writes = await asyncio.to_thread(store.begin_rebuild, space_id, interval)
+                if writes is not None:
+                    await _rebuild(space_id, writes)
+            except Exception as e:
+                logger.warning(f"Snapshot compaction of space {space_id} failed: {e}")
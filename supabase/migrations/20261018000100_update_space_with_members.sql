@@ -0,0 +1,50 @@
+-- スペース情報更新API (/api/spaces/{space_id}/update/) 用のストアドファンクション。
+-- タイトル更新・メンバー削除・メンバー追加・更新後データの取得を1トランザクション・1往復で行う。
+-- スペースが存在しない場合は NULL を返す。
+create or replace function public.update_space_with_members(
+  p_space_id uuid,
+  p_title text default null,
+  p_members_to_add text[] default null,
+  p_members_to_delete text[] default null,
+  p_updated_at timestamptz default now()
+) returns jsonb
+language plpgsql
+as $$
+begin
+  -- 対象スペースの存在確認と行ロック
+  perform 1 from public.spaces where id = p_space_id for update;
+  if not found then
+    return null;
+  end if;
+
+  -- タイトルが指定されている場合のみ更新
+  if p_title is not null then
+    update public.spaces
+       set title = p_title,
+           updated_at = p_updated_at
+     where id = p_space_id;
+  end if;
+
+  -- 指定されたニックネームのメンバーを削除
+  if p_members_to_delete is not null and cardinality(p_members_to_delete) > 0 then
+    delete from public.space_members
+     where space_id = p_space_id
+       and nickname = any(p_members_to_delete);
+  end if;
+
+  -- 新しいメンバーを追加（デフォルトロールは editor）
+  if p_members_to_add is not null and cardinality(p_members_to_add) > 0 then
+    insert into public.space_members (id, space_id, role, nickname, created_at)
+    select gen_random_uuid(), p_space_id, 'editor', nickname, p_updated_at
+      from unnest(p_members_to_add) as nickname;
+  end if;
+
+  return jsonb_build_object(
+    'space', (select to_jsonb(s) from public.spaces s where s.id = p_space_id),
+    'members', coalesce(
+      (select jsonb_agg(to_jsonb(m)) from public.space_members m where m.space_id = p_space_id),
+      '[]'::jsonb
+    )
+  );
+end;
+$$;
@@ -0,0 +1,15 @@
+-- 目標一覧取得API (/api/goals/list/{space_id}/get/) 用のステータス別件数集計。
+-- 目標の行を転送せずに、スペース内のステータスごとの件数だけを返す。
+create index if not exists goals_space_id_status_idx
+  on public.goals (space_id, status);
+
+create or replace function public.goal_status_counts(p_space_id uuid)
+returns table (status text, count bigint)
+language sql
+stable
+as $$
+  select g.status, count(*)
+    from public.goals g
+   where g.space_id = p_space_id
+   group by g.status;
+$$;
@@ -0,0 +1,72 @@
+-- 目標一括操作API (/api/spaces/{space_id}/goals/batch) 用のストアドファンクション。
+-- p_ops は操作の配列で、各要素は次の形式:
+--   {"index": 0, "op": "create" | "patch" | "close" | "reorder", "goal_id": "...", <更新するカラム>...}
+-- create はまとめて1回のINSERTで追加し、その後 patch / close / reorder を配列の順にサーバー側で適用する。
+-- 全体が1トランザクションで実行され、create 以外の操作について
+--   [{"index": 0, "goal_id": "...", "found": true}, ...]
+-- を返す（found = false は対象の目標がスペース内に存在しなかったことを示す）。
+create or replace function public.apply_goal_batch(
+  p_space_id uuid,
+  p_ops jsonb,
+  p_updated_at timestamptz default now()
+) returns jsonb
+language plpgsql
+as $$
+declare
+  v_op jsonb;
+  v_id uuid;
+  v_results jsonb := '[]'::jsonb;
+begin
+  insert into public.goals
+    (id, space_id, title, detail, assignee, due_on, status, tags, order_index, created_at, updated_at)
+  select (o->>'goal_id')::uuid,
+         p_space_id,
+         o->>'title',
+         o->>'detail',
+         o->>'assignee',
+         (o->>'due_on')::date,
+         coalesce(o->>'status', 'todo'),
+         coalesce(array(select jsonb_array_elements_text(o->'tags')), '{}'::text[]),
+         coalesce((o->>'order_index')::int, 0),
+         p_updated_at,
+         p_updated_at
+    from jsonb_array_elements(p_ops) as o
+   where o->>'op' = 'create';
+
+  for v_op in select o from jsonb_array_elements(p_ops) as o where o->>'op' <> 'create' loop
+    if v_op->>'op' = 'close' then
+      update public.goals
+         set status = 'close', updated_at = p_updated_at
+       where id = (v_op->>'goal_id')::uuid and space_id = p_space_id
+      returning id into v_id;
+    elsif v_op->>'op' = 'reorder' then
+      update public.goals
+         set order_index = (v_op->>'order_index')::int, updated_at = p_updated_at
+       where id = (v_op->>'goal_id')::uuid and space_id = p_space_id
+      returning id into v_id;
+    else
+      -- patch: 指定されたカラムだけを更新する
+      update public.goals
+         set title = case when v_op ? 'title' then v_op->>'title' else title end,
+             detail = case when v_op ? 'detail' then v_op->>'detail' else detail end,
+             assignee = case when v_op ? 'assignee' then v_op->>'assignee' else assignee end,
+             due_on = case when v_op ? 'due_on' then (v_op->>'due_on')::date else due_on end,
+             status = case when v_op ? 'status' then v_op->>'status' else status end,
+             tags = case when v_op ? 'tags' then array(select jsonb_array_elements_text(v_op->'tags')) else tags end,
+             order_index = case when v_op ? 'order_index' then (v_op->>'order_index')::int else order_index end,
+             updated_at = p_updated_at
+       where id = (v_op->>'goal_id')::uuid and space_id = p_space_id
+      returning id into v_id;
+    end if;
+
+    v_results := v_results || jsonb_build_object(
+      'index', (v_op->>'index')::int,
+      'goal_id', v_op->>'goal_id',
+      'found', v_id is not null
+    );
+    v_id := null;
+  end loop;
+
+  return v_results;
+end;
+$$;
@@ -0,0 +1,18 @@
+-- リアクション一覧取得API (/api/goals/{goal_id}/reactions/get/?mode=summary) 用の集計。
+-- 目標に付いたリアクションを絵文字ごとに集計し、p_author がその絵文字でリアクション済みかどうかを返す。
+create index if not exists reactions_goal_id_emoji_idx
+  on public.reactions (goal_id, emoji);
+
+create or replace function public.reaction_summary(p_goal_id uuid, p_author text default null)
+returns table (emoji text, count bigint, reacted boolean)
+language sql
+stable
+as $$
+  select r.emoji,
+         count(*),
+         coalesce(bool_or(r.author = p_author), false)
+    from public.reactions r
+   where r.goal_id = p_goal_id
+   group by r.emoji
+   order by count(*) desc, min(r.created_at);
+$$;
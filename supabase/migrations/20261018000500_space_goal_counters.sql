@@ -0,0 +1,58 @@
+-- スペース進捗サマリー取得API (/api/spaces/{space_id}/summary/get/) 用の集計カウンター。
+-- スペース・ステータス・担当者ごとの目標数を保持し、goals への INSERT / UPDATE / DELETE のたびに
+-- トリガーで差分だけを更新する（目標作成・更新・クローズ・一括操作のいずれの経路でも更新される）。
+create table if not exists public.space_goal_counters (
+  space_id uuid not null references public.spaces (id) on delete cascade,
+  status text not null,
+  assignee text not null default '',
+  goal_count integer not null default 0,
+  primary key (space_id, status, assignee)
+);
+
+create or replace function public.bump_space_goal_counter(
+  p_space_id uuid, p_status text, p_assignee text, p_delta integer
+) returns void
+language sql
+as $$
+  insert into public.space_goal_counters (space_id, status, assignee, goal_count)
+  values (p_space_id, p_status, coalesce(p_assignee, ''), p_delta)
+  on conflict (space_id, status, assignee)
+  do update set goal_count = public.space_goal_counters.goal_count + excluded.goal_count;
+$$;
+
+create or replace function public.goals_maintain_counters()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    if tg_op = 'DELETE'
+       or old.space_id is distinct from new.space_id
+       or old.status is distinct from new.status
+       or old.assignee is distinct from new.assignee then
+      perform public.bump_space_goal_counter(old.space_id, old.status, old.assignee, -1);
+    else
+      -- ステータス・担当者が変わらない更新ではカウンターを触らない
+      return null;
+    end if;
+  end if;
+
+  if tg_op in ('INSERT', 'UPDATE') then
+    perform public.bump_space_goal_counter(new.space_id, new.status, new.assignee, 1);
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists goals_maintain_counters on public.goals;
+create trigger goals_maintain_counters
+  after insert or update of space_id, status, assignee or delete on public.goals
+  for each row execute function public.goals_maintain_counters();
+
+-- 既存の目標からカウンターを初期化する
+insert into public.space_goal_counters (space_id, status, assignee, goal_count)
+select space_id, status, coalesce(assignee, ''), count(*)
+  from public.goals
+ group by space_id, status, coalesce(assignee, '')
+on conflict (space_id, status, assignee)
+do update set goal_count = excluded.goal_count;
@@ -0,0 +1,10 @@
+-- エクスポートAPI (/api/spaces/{space_id}/export) とコメント一覧のキーセットページング用のインデックス。
+-- (created_at, id) 順のページを、スペース・目標ごとにインデックスだけで辿れるようにする。
+create index if not exists goals_space_id_created_at_id_idx
+  on public.goals (space_id, created_at, id);
+
+create index if not exists comments_goal_id_created_at_id_idx
+  on public.comments (goal_id, created_at, id);
+
+create index if not exists reactions_goal_id_created_at_id_idx
+  on public.reactions (goal_id, created_at, id);
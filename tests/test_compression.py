@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import CompressionMiddleware, add_vary  # noqa: E402
+
+LARGE = {"items": ["x" * 100] * 100}
+
+
+def large(request):
+    return JSONResponse(LARGE, headers={"Vary": "Origin"})
+
+
+def small(request):
+    return JSONResponse({"ok": True})
+
+
+def events(request):
+    return PlainTextResponse("data: x\n\n", media_type="text/event-stream")
+
+
+@pytest.fixture
+def client():
+    app = Starlette(routes=[Route("/large", large), Route("/small", small), Route("/events", events)])
+    return TestClient(CompressionMiddleware(app, minimum_size=1024))
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip", "identity", ""])
+def test_vary_is_merged_into_one_header(client, accept_encoding):
+    res = client.get("/large", headers={"Accept-Encoding": accept_encoding})
+    assert res.headers.get_list("vary") == ["Origin, Accept-Encoding"]
+    assert res.headers.get("content-encoding") == ("gzip" if accept_encoding == "gzip" else None)
+    assert res.json() == LARGE
+
+
+def test_vary_on_uncompressed_small_response(client):
+    res = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert res.headers.get("content-encoding") is None
+    assert res.headers.get_list("vary") == ["Accept-Encoding"]
+
+
+def test_no_vary_on_responses_that_are_never_compressed(client):
+    res = client.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "vary" not in res.headers
+
+
+def test_add_vary_keeps_existing_accept_encoding_and_wildcard():
+    assert add_vary([(b"vary", b"accept-encoding")]) == [(b"vary", b"accept-encoding")]
+    assert add_vary([(b"vary", b"*")]) == [(b"vary", b"*")]
+    assert add_vary([(b"vary", b"Origin"), (b"vary", b"Cookie")]) == [(b"vary", b"Origin, Cookie, Accept-Encoding")]
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import goal_import  # noqa: E402
+
+NOW = "2024-01-01T00:00:00+00:00"
+
+
+def parse(*chunks: bytes) -> list:
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [record async for record in goal_import.iter_csv_records(source())]
+
+    return asyncio.run(collect())
+
+
+def split_every(data: bytes, size: int) -> list:
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_quoted_newlines_stay_in_one_record():
+    data = b'id,title,detail\n,"a","line1\nline2\r\nline3"\n,b,""\n'
+    expected = [["id", "title", "detail"], ["", "a", "line1\nline2\r\nline3"], ["", "b", ""]]
+    assert parse(data) == expected
+    # どこでチャンクが切れても同じ結果になる
+    for size in range(1, len(data)):
+        assert parse(*split_every(data, size)) == expected
+
+
+def test_crlf_split_across_chunks():
+    assert parse(b"id,title\r", b"\n,a\r", b"\n,b\r\n") == [["id", "title"], ["", "a"], ["", "b"]]
+
+
+def test_bare_cr_ends_a_record_like_csv_module():
+    assert parse(b"id,title\r,a\r,b") == [["id", "title"], ["", "a"], ["", "b"]]
+
+
+def test_bom_is_removed_even_when_split():
+    data = "\ufeffid,title\n,目標\n".encode("utf-8")
+    assert parse(data[:2], data[2:5], data[5:]) == [["id", "title"], ["", "目標"]]
+
+
+def test_other_unicode_line_breaks_are_not_record_separators():
+    data = "id,title\n,a\u2028b\u2029c\x85d\x0be\x0cf\x1cg\x1dh\x1ei\n".encode("utf-8")
+    assert parse(data) == [["id", "title"], ["", "a\u2028b\u2029c\x85d\x0be\x0cf\x1cg\x1dh\x1ei"]]
+
+
+def test_last_record_without_newline():
+    assert parse(b'id,title\n,"x ""y"""') == [["id", "title"], ["", 'x "y"']]
+
+
+def test_derived_ids_differ_between_imports():
+    values = {"title": "goal"}
+    first, _ = goal_import.validate_row(values, 1, "space", "import-a", NOW)
+    again, _ = goal_import.validate_row(values, 1, "space", "import-a", NOW)
+    other, _ = goal_import.validate_row(values, 1, "space", "import-b", NOW)
+    assert first["id"] == again["id"]
+    assert first["id"] != other["id"]
+
+
+def test_explicit_id_is_kept():
+    goal, errors = goal_import.validate_row({"id": "6F1C3F0E-8D0A-4B7E-9A57-0C1F3C7A2D41", "title": "goal"},
+                                            1, "space", "import-a", NOW)
+    assert errors == []
+    assert goal["id"] == "6f1c3f0e-8d0a-4b7e-9a57-0c1f3c7a2d41"
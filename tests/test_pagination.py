@@ -0,0 +1,37 @@
+import base64
+import json
+import os
+import sys
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pagination import decode_cursor, encode_cursor  # noqa: E402
+
+ROW_ID = "6f1c3f0e-8d0a-4b7e-9a57-0c1f3c7a2d41"
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_round_trip():
+    row = {"created_at": "2024-01-01T09:00:00.123456+09:00", "id": ROW_ID}
+    assert decode_cursor(encode_cursor(row)) == (row["created_at"], ROW_ID)
+
+
+@pytest.mark.parametrize("cursor", [
+    raw_cursor(['2024-01-01",id.gt."0', ROW_ID]),             # フィルター式を書き換えようとする created_at
+    raw_cursor(["2024-01-01T00:00:00+00:00", 'x"),or(id.gt.']),  # UUIDでない id
+    raw_cursor(["yesterday", ROW_ID]),
+    raw_cursor([1, str(uuid.uuid4())]),
+    raw_cursor(["2024-01-01T00:00:00+00:00"]),
+    "not base64!",
+])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor)
+    assert excinfo.value.status_code == 400
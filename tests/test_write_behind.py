@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from postgrest.exceptions import APIError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import write_behind  # noqa: E402
+
+
+class FakeTable:
+    def upsert(self, rows, **kwargs):
+        return rows
+
+
+def error(code) -> APIError:
+    return APIError({"message": "error", "code": code})
+
+
+@pytest.mark.parametrize("code, rejected", [
+    ("23503", True),      # 外部キー違反（削除済みの目標）
+    ("22P02", True),      # 不正な入力値
+    ("PGRST102", True),   # 不正なリクエストボディ
+    (400, True),
+    ("PGRST000", False),  # データベースに接続できない
+    ("57014", False),     # タイムアウトによるキャンセル
+    ("40001", False),     # シリアライズ失敗
+    (503, False),
+    (429, False),
+    (None, False),
+])
+def test_is_rejected(code, rejected):
+    assert write_behind.is_rejected(error(code)) is rejected
+
+
+def run_flush(monkeypatch, tmp_path, bodies, fail):
+    """bodies の行をキューに入れて1回書き出し、(例外, 挿入された本文, on_flushed の本文, キュー) を返す。"""
+    stored = []
+    flushed = []
+
+    async def fake_execute(rows):
+        exc = fail(rows)
+        if exc is not None:
+            raise exc
+        stored.extend(row["body"] for row in rows)
+
+    async def on_flushed(table_name, rows):
+        flushed.extend(row["body"] for row in rows)
+
+    monkeypatch.setattr(write_behind, "execute", fake_execute)
+    monkeypatch.setattr(write_behind, "table", lambda name: FakeTable())
+
+    async def main():
+        queue = write_behind.WriteBehindQueue(directory=str(tmp_path), on_flushed=on_flushed)
+        await asyncio.to_thread(queue._open_file)
+        for body in bodies:
+            queue._append("comments", f'{{"id": "{body}", "body": "{body}"}}')
+            queue._pending += 1
+        try:
+            await queue.flush_once()
+        except Exception as e:
+            return e, queue
+        return None, queue
+
+    exc, queue = asyncio.run(main())
+    return exc, stored, flushed, queue
+
+
+def queued(queue) -> list:
+    return [row[2] for row in queue._read_batch()]
+
+
+def test_rejected_row_is_dead_lettered(monkeypatch, tmp_path):
+    exc, stored, flushed, queue = run_flush(
+        monkeypatch, tmp_path, ["a", "bad", "c"],
+        lambda rows: error("23503") if any(row["body"] == "bad" for row in rows) else None)
+    assert exc is None
+    assert stored == flushed == ["a", "c"]
+    assert queued(queue) == []
+    assert queue.stats()["dead_lettered"] == 1
+    assert queue.stats()["pending"] == 0
+
+
+def test_server_error_keeps_rows_queued(monkeypatch, tmp_path):
+    exc, stored, flushed, queue = run_flush(monkeypatch, tmp_path, ["a", "b"], lambda rows: error(503))
+    assert isinstance(exc, APIError)
+    assert stored == flushed == []
+    assert len(queued(queue)) == 2
+    assert queue.stats()["dead_lettered"] == 0
+
+
+def test_server_error_while_retrying_rows_one_by_one(monkeypatch, tmp_path):
+    def fail(rows):
+        if len(rows) > 1:
+            return error("23505")
+        if rows[0]["body"] == "b":
+            return error("PGRST000")
+        return None
+
+    exc, stored, flushed, queue = run_flush(monkeypatch, tmp_path, ["a", "b", "c"], fail)
+    assert isinstance(exc, APIError)
+    # 挿入できた行だけをキューから消し、一時的なエラー以降の行は残す
+    assert stored == flushed == ["a"]
+    assert len(queued(queue)) == 2
+    assert queue.stats()["dead_lettered"] == 0
+    assert queue.stats()["pending"] == 2
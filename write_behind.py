@@ -0,0 +1,289 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+from repository import execute, table
+
+logger = logging.getLogger("uvicorn.error")
+
+# コメント・リアクションの書き込みをキューに溜めてまとめて挿入するかどうか（"1"で有効）
+WRITE_BEHIND_ENABLED = os.getenv("TODOLIS_WRITE_BEHIND", "0") == "1"
+# キュー（SQLiteファイル）の保存先。ワーカープロセスごとに1ファイル作る
+WRITE_BEHIND_DIR = os.getenv("TODOLIS_WRITE_BEHIND_DIR", os.path.join(tempfile.gettempdir(), "todolis-write-behind"))
+# 最初の書き込みからこの時間（ミリ秒）が経つか、WRITE_BEHIND_BATCH_SIZE 件溜まったら挿入する
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("TODOLIS_WRITE_BEHIND_FLUSH_MS", "5"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("TODOLIS_WRITE_BEHIND_BATCH_SIZE", "200"))
+# Supabaseへの挿入に失敗した場合に再試行するまでの秒数
+WRITE_BEHIND_RETRY_SECONDS = float(os.getenv("TODOLIS_WRITE_BEHIND_RETRY_SECONDS", "1"))
+# 終了時にキューを書き出すのを待つ最大秒数（残りはファイルに残り、次の起動時に書き出される）
+WRITE_BEHIND_DRAIN_SECONDS = float(os.getenv("TODOLIS_WRITE_BEHIND_DRAIN_SECONDS", "10"))
+# SQLite の synchronous 設定。NORMAL はプロセスの異常終了では失われず、OSの停止では直前の数件が失われうる
+WRITE_BEHIND_SYNCHRONOUS = os.getenv("TODOLIS_WRITE_BEHIND_SYNCHRONOUS", "NORMAL").upper()
+
+WRITE_BEHIND_TABLES = ("comments", "reactions")
+# 行の内容が原因で拒否されたとみなすエラー。PostgreSQLのSQLSTATEのクラス（22: データ例外, 23: 制約違反）と
+# PostgRESTのリクエストエラー (PGRST1xx)。それ以外（5xx・接続エラーなど）は再試行する
+REJECTED_SQLSTATE_CLASSES = ("22", "23")
+REJECTED_PGRST_PREFIX = "PGRST1"
+
+_SCHEMA = """
+create table if not exists queue (
+    seq integer primary key autoincrement,
+    table_name text not null,
+    payload text not null
+);
+create table if not exists dead_letter (
+    seq integer primary key,
+    table_name text not null,
+    payload text not null,
+    error text not null,
+    failed_at text not null default (datetime('now'))
+);
+"""
+
+
+def is_rejected(error: APIError) -> bool:
+    """Supabaseが行そのものを拒否したエラーか（再試行しても成功しないため dead_letter に移す）。"""
+    code = error.code
+    if isinstance(code, int):
+        # 本文がJSONでない応答では code にHTTPステータスが入る
+        return 400 <= code < 500 and code not in (408, 429)
+    if not isinstance(code, str):
+        return False
+    if code.startswith("PGRST"):
+        return code.startswith(REJECTED_PGRST_PREFIX)
+    return len(code) == 5 and code[:2] in REJECTED_SQLSTATE_CLASSES
+
+
+class WriteBehindQueue:
+    """
+    コメント・リアクションの行をローカルのSQLiteファイルに追記し、バックグラウンドでまとめて挿入する。
+
+    - enqueue() はファイルへの追記が終わった時点で戻るため、リクエストはSupabaseへの往復を待たずに応答できる
+    - 行は追記順 (seq) に、テーブルごとの複数行の upsert で挿入する。同じ目標への書き込みの順序は保たれる
+    - 挿入済みの行を消す前にプロセスが落ちても、id が一致する行は無視して挿入する (ignore-duplicates) ため重複しない
+    - Supabaseに拒否された行（削除済みの目標へのコメントなど）は dead_letter テーブルに移し、後続の行を止めない。
+      5xx などの一時的なエラーでは行をキューに残して再試行する
+    - 各ワーカーは自分のファイルを flock で保持する。ロックが外れたファイル（終了したワーカーの残り）は
+      起動時に引き取って書き出す
+    """
+
+    def __init__(self, directory: str = WRITE_BEHIND_DIR, flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE, retry_seconds: float = WRITE_BEHIND_RETRY_SECONDS,
+                 on_flushed: Optional[Callable[[str, List[dict]], Awaitable[None]]] = None):
+        self.directory = directory
+        self.flush_ms = flush_ms
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        self.on_flushed = on_flushed
+        self.path: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock_file = None
+        self._db_lock = threading.Lock()
+        self._pending = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"enqueued": 0, "flushed": 0, "batches": 0, "dead_lettered": 0, "failures": 0}
+
+    # --- SQLite ---------------------------------------------------------------
+    def _connect(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.execute("pragma journal_mode=wal")
+        conn.execute(f"pragma synchronous={WRITE_BEHIND_SYNCHRONOUS}")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _open_file(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"queue-{os.getpid()}-{uuid.uuid4().hex[:8]}.sqlite3")
+        self._lock_file = open(self.path + ".lock", "w")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._conn = self._connect(self.path)
+        self._adopt_orphans()
+        self._pending = self._conn.execute("select count(*) from queue").fetchone()[0]
+
+    def _adopt_orphans(self) -> None:
+        """終了したワーカーが残したキューの行を、順序を保ったまま自分のキューへ移す。"""
+        for path in sorted(glob.glob(os.path.join(self.directory, "queue-*.sqlite3"))):
+            if path == self.path:
+                continue
+            with open(path + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # 稼働中のワーカーのファイル
+                try:
+                    if not os.path.exists(path):
+                        continue  # 同時に起動した別のワーカーが引き取り済み
+                    orphan = self._connect(path)
+                    with orphan:
+                        rows = orphan.execute("select table_name, payload from queue order by seq").fetchall()
+                        dead = orphan.execute("select table_name, payload, error, failed_at from dead_letter").fetchall()
+                    orphan.close()
+                    with self._conn:
+                        self._conn.executemany("insert into queue (table_name, payload) values (?, ?)", rows)
+                        self._conn.executemany("insert into dead_letter (table_name, payload, error, failed_at) "
+                                               "values (?, ?, ?, ?)", dead)
+                    if rows:
+                        logger.info(f"Adopted {len(rows)} queued writes from {os.path.basename(path)}")
+                    for suffix in ("", "-wal", "-shm", ".lock"):
+                        if os.path.exists(path + suffix):
+                            os.remove(path + suffix)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, table_name: str, payload: str) -> None:
+        with self._db_lock:
+            self._conn.execute("insert into queue (table_name, payload) values (?, ?)", (table_name, payload))
+
+    def _read_batch(self) -> List[Tuple[int, str, str]]:
+        with self._db_lock:
+            return self._conn.execute("select seq, table_name, payload from queue order by seq limit ?",
+                                      (self.batch_size,)).fetchall()
+
+    def _delete(self, seqs: List[int]) -> None:
+        with self._db_lock, self._conn:
+            self._conn.executemany("delete from queue where seq = ?", [(seq,) for seq in seqs])
+
+    def _dead_letter(self, seq: int, table_name: str, payload: str, error: str) -> None:
+        with self._db_lock, self._conn:
+            self._conn.execute("insert into dead_letter (table_name, payload, error) values (?, ?, ?)",
+                               (table_name, payload, error))
+            self._conn.execute("delete from queue where seq = ?", (seq,))
+
+    # --- 公開API ---------------------------------------------------------------
+    async def start(self) -> None:
+        await asyncio.to_thread(self._open_file)
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, table_name: str, row: dict) -> None:
+        """行をキューに追記する。追記がファイルに書き込まれてから戻る。"""
+        if table_name not in WRITE_BEHIND_TABLES:
+            raise ValueError(f"Unsupported table for write-behind: {table_name}")
+        await asyncio.to_thread(self._append, table_name, json.dumps(row, ensure_ascii=False))
+        self._pending += 1
+        self._stats["enqueued"] += 1
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "pending": self._pending}
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # 最初の1件から flush_ms 待つ間に届いた書き込みも同じ挿入にまとめる（batch_size に達したらすぐ挿入する）
+            if self._pending < self.batch_size:
+                await asyncio.sleep(self.flush_ms / 1000)
+            self._wakeup.clear()
+            try:
+                while await self.flush_once():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["failures"] += 1
+                logger.warning(f"Write-behind flush failed, retrying in {self.retry_seconds}s: {e}")
+                await asyncio.sleep(self.retry_seconds)
+                self._wakeup.set()
+
+    async def flush_once(self) -> bool:
+        """
+        キューの先頭から batch_size 件を挿入する。挿入した行があれば True を返す。
+        Supabaseに接続できないなどの失敗は例外として送出し、行はキューに残す。
+        """
+        batch = await asyncio.to_thread(self._read_batch)
+        if not batch:
+            return False
+        # テーブルごとに1回の挿入にまとめる。テーブル内では追記順を保つため、同じ目標への書き込みの順序は変わらない
+        groups: Dict[str, List[Tuple[int, str, str]]] = {}
+        for item in batch:
+            groups.setdefault(item[1], []).append(item)
+        for table_name, items in groups.items():
+            await self._insert(table_name, items)
+        return True
+
+    async def _insert(self, table_name: str, items: List[Tuple[int, str, str]]) -> None:
+        rows = [json.loads(payload) for _, _, payload in items]
+        failure = None
+        try:
+            await execute(table(table_name).upsert(rows, on_conflict="id", ignore_duplicates=True,
+                                                   returning=ReturnMethod.minimal))
+            inserted = list(zip(items, rows))
+        except APIError as e:
+            if not is_rejected(e):
+                raise
+            # まとめた挿入が拒否された場合は1行ずつ挿入し直し、拒否された行だけを取り除く
+            inserted = []
+            for item, row in zip(items, rows):
+                try:
+                    await execute(table(table_name).upsert([row], on_conflict="id", ignore_duplicates=True,
+                                                           returning=ReturnMethod.minimal))
+                    inserted.append((item, row))
+                except Exception as e:
+                    if not isinstance(e, APIError) or not is_rejected(e):
+                        # 一時的なエラー。挿入済みの行を取り除いてから送出し、残りの行は再試行する
+                        failure = e
+                        break
+                    logger.error(f"Write-behind {table_name} row {row.get('id')} rejected: {e}")
+                    await asyncio.to_thread(self._dead_letter, item[0], table_name, item[2], str(e))
+                    self._pending -= 1
+                    self._stats["dead_lettered"] += 1
+        if inserted:
+            await asyncio.to_thread(self._delete, [item[0] for item, _ in inserted])
+            self._pending -= len(inserted)
+            self._stats["flushed"] += len(inserted)
+            self._stats["batches"] += 1
+            if self.on_flushed is not None:
+                await self.on_flushed(table_name, [row for _, row in inserted])
+        if failure is not None:
+            raise failure
+
+    async def drain(self, timeout: float = WRITE_BEHIND_DRAIN_SECONDS) -> None:
+        """バックグラウンドの挿入を止め、残っている行を timeout 秒まで書き出してからファイルを閉じる。"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await asyncio.wait_for(self._drain_all(), timeout)
+        except Exception as e:
+            logger.warning(f"Write-behind drain stopped with {self._pending} writes pending "
+                           f"(kept in {self.path}): {e}")
+        await asyncio.to_thread(self._close)
+
+    async def _drain_all(self) -> None:
+        while await self.flush_once():
+            pass
+
+    def _close(self) -> None:
+        with self._db_lock:
+            remaining = self._conn.execute("select (select count(*) from queue) + (select count(*) from dead_letter)").fetchone()[0]
+            self._conn.close()
+            self._conn = None
+        # 空のファイルは消す。行が残っている場合は次に起動したワーカーが引き取る
+        if not remaining:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        if not remaining:
+            os.remove(self.path + ".lock")